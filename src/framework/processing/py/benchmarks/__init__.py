@@ -0,0 +1,11 @@
+"""
+Benchmarks for the port package, run them from the directory containing pyproject.toml:
+
+    python -m benchmarks.throughput --sizes 1MB 10MB 100MB
+    python -m benchmarks.memory --size 50MB --budget read_json_from_bytes=10x
+    python -m benchmarks.startup
+    python -m benchmarks.read_json --size 50MB
+    python -m benchmarks.validate --categories 10 100 500
+
+Exports are generated with benchmarks.generate, these are not shipped with the port package
+"""
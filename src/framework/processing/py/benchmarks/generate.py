@@ -0,0 +1,227 @@
+"""
+Deterministic generator of synthetic ChatGPT exports
+
+The zip has the layout of a real export: conversations.json, user.json, message_feedback.json and chat.html.
+conversations.json is written in a streaming fashion, so exports of several GB can be generated
+
+    python -m benchmarks.generate export.zip --size 100MB
+"""
+from dataclasses import dataclass
+from pathlib import Path
+import argparse
+import json
+import random
+import re
+import zipfile
+
+WORDS = (
+    "the model answer question python data table please explain why how what code function error "
+    "de het een van is dat niet voor met wat hoe waarom uitleg vraag antwoord gegevens tabel "
+    "study research participant donation privacy consent export file json zip browser memory "
+    "write summary translate example list number result value test performance"
+).split()
+
+MODELS = ["text-davinci-002-render-sha", "gpt-4", "gpt-4o", "gpt-4o-mini"]
+
+START_TIME = 1_680_000_000.0
+
+_SIZE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(B|KB|MB|GB)?\s*$", re.IGNORECASE)
+_UNITS = {"B": 1, "KB": 1 << 10, "MB": 1 << 20, "GB": 1 << 30}
+
+
+def parse_size(size: str) -> int:
+    """
+    Parses sizes like "500KB", "10MB" or "2GB" to a number of bytes
+    """
+    match = _SIZE.match(size)
+    if match is None:
+        raise ValueError(f"Not a size: {size}")
+    number, unit = match.groups()
+    return int(float(number) * _UNITS[(unit or "B").upper()])
+
+
+@dataclass
+class ExportSpec:
+    """
+    Shape of a generated export
+
+    Attributes:
+        size: approximate number of bytes of conversations.json
+        seed: seed of the random generator, the same spec always gives the same export
+        turns: minimum and maximum number of visible turns per conversation
+        branching: probability that an assistant turn was regenerated, leaving an abandoned branch
+        multimodal: probability that a user turn contains an image part
+        hidden_system: add a hidden system node at the start of every conversation
+        words: minimum and maximum number of words per message
+    """
+
+    size: int
+    seed: int = 0
+    turns: tuple[int, int] = (2, 30)
+    branching: float = 0.1
+    multimodal: float = 0.05
+    hidden_system: bool = True
+    words: tuple[int, int] = (5, 120)
+
+
+class _ConversationFactory:
+    def __init__(self, spec: ExportSpec):
+        self.spec = spec
+        self.rng = random.Random(spec.seed)
+        self.n_ids = 0
+        self.time = START_TIME
+
+    def new_id(self) -> str:
+        self.n_ids += 1
+        return f"{self.n_ids:08x}-0000-4000-8000-{self.spec.seed:012x}"
+
+    def text(self) -> str:
+        n = self.rng.randint(*self.spec.words)
+        return " ".join(self.rng.choice(WORDS) for _ in range(n))
+
+    def node(self, mapping: dict, parent: str | None, message: dict | None) -> str:
+        node_id = self.new_id()
+        mapping[node_id] = {"id": node_id, "message": message, "parent": parent, "children": []}
+        if parent is not None:
+            mapping[parent]["children"].append(node_id)
+        return node_id
+
+    def message(self, role: str, parts: list, metadata: dict | None = None) -> dict:
+        self.time += self.rng.uniform(1, 300)
+        return {
+            "id": self.new_id(),
+            "author": {"role": role, "name": None, "metadata": {}},
+            "create_time": self.time,
+            "update_time": None,
+            "content": {"content_type": "multimodal_text" if len(parts) > 1 else "text", "parts": parts},
+            "status": "finished_successfully",
+            "end_turn": True if role == "assistant" else None,
+            "weight": 1.0,
+            "metadata": metadata or {},
+            "recipient": "all",
+        }
+
+    def user_parts(self) -> list:
+        if self.rng.random() < self.spec.multimodal:
+            image = {
+                "content_type": "image_asset_pointer",
+                "asset_pointer": f"file-service://file-{self.new_id()}",
+                "size_bytes": self.rng.randint(10_000, 2_000_000),
+                "width": 1024,
+                "height": 768,
+                "fovea": None,
+                "metadata": None,
+            }
+            return [image, self.text()]
+        return [self.text()]
+
+    def assistant_message(self) -> dict:
+        model = self.rng.choice(MODELS)
+        metadata = {
+            "finish_details": {"type": "stop", "stop_tokens": [100260]},
+            "model_slug": model,
+            "default_model_slug": model,
+            "parent_id": self.new_id(),
+            "timestamp_": "absolute",
+        }
+        return self.message("assistant", [self.text()], metadata)
+
+    def conversation(self) -> dict:
+        mapping: dict = {}
+        create_time = self.time
+        current = self.node(mapping, None, None)
+
+        if self.spec.hidden_system:
+            system = self.message("system", [""], {"is_visually_hidden_from_conversation": True})
+            current = self.node(mapping, current, system)
+
+        for _ in range(self.rng.randint(*self.spec.turns) // 2 or 1):
+            current = self.node(mapping, current, self.message("user", self.user_parts()))
+            if self.rng.random() < self.spec.branching:
+                self.node(mapping, current, self.assistant_message())
+            current = self.node(mapping, current, self.assistant_message())
+
+        return {
+            "title": " ".join(self.rng.choice(WORDS) for _ in range(self.rng.randint(1, 6))).capitalize(),
+            "create_time": create_time,
+            "update_time": self.time,
+            "mapping": mapping,
+            "moderation_results": [],
+            "current_node": current,
+            "plugin_ids": None,
+            "conversation_id": self.new_id(),
+            "conversation_template_id": None,
+            "id": self.new_id(),
+        }
+
+
+def _member(name: str) -> zipfile.ZipInfo:
+    # Fixed timestamp, so the same spec gives a byte identical zip
+    info = zipfile.ZipInfo(name, date_time=(2024, 1, 1, 0, 0, 0))
+    info.compress_type = zipfile.ZIP_DEFLATED
+    return info
+
+
+@dataclass
+class GeneratedExport:
+    path: Path
+    n_conversations: int
+    conversations_bytes: int
+
+
+def generate_export(path: str | Path, spec: ExportSpec) -> GeneratedExport:
+    """
+    Writes a synthetic ChatGPT export to path
+    """
+    factory = _ConversationFactory(spec)
+    n_conversations = 0
+    n_bytes = 0
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        with zf.open(_member("conversations.json"), "w", force_zip64=True) as f:
+            f.write(b"[")
+            n_bytes += 1
+            while n_bytes < spec.size or n_conversations == 0:
+                data = json.dumps(factory.conversation()).encode("utf-8")
+                if n_conversations > 0:
+                    data = b", " + data
+                f.write(data)
+                n_bytes += len(data)
+                n_conversations += 1
+            f.write(b"]")
+            n_bytes += 1
+
+        zf.writestr(_member("user.json"), json.dumps({
+            "id": "user-0000", "email": "participant@example.org", "chatgpt_plus_user": False, "phone_number": None,
+        }))
+        zf.writestr(_member("message_feedback.json"), json.dumps([
+            {"id": factory.new_id(), "conversation_id": factory.new_id(), "user_id": "user-0000", "rating": "thumbsUp"}
+        ]))
+        zf.writestr(_member("chat.html"), "<html><head><title>ChatGPT Data Export</title></head><body></body></html>")
+
+    return GeneratedExport(Path(path), n_conversations, n_bytes)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--size", default="1MB")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--branching", type=float, default=0.1)
+    parser.add_argument("--multimodal", type=float, default=0.05)
+    parser.add_argument("--no-hidden-system", action="store_true")
+    args = parser.parse_args()
+
+    spec = ExportSpec(
+        size=parse_size(args.size),
+        seed=args.seed,
+        branching=args.branching,
+        multimodal=args.multimodal,
+        hidden_system=not args.no_hidden_system,
+    )
+    export = generate_export(args.path, spec)
+    print(f"Wrote {export.path}: {export.n_conversations} conversations, {export.conversations_bytes} bytes")
+
+
+if __name__ == "__main__":
+    main()
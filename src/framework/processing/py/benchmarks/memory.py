@@ -0,0 +1,171 @@
+"""
+Peak memory per stage of the ChatGPT extraction, measured with tracemalloc on generated exports
+
+    python -m benchmarks.memory --size 50MB --budget read_json_from_bytes=10x to_json=200MB
+
+Stages: zip_read, read_json_from_bytes, dict_denester, flatten, dataframe_build, to_json
+and streaming_conversations_to_df (the streaming path used by the script, end to end).
+
+Peak is the highest allocation during the stage, retained is what is still allocated after it,
+both relative to what was allocated before the stage.
+A budget is a number of bytes ("200MB") or a multiple of the size of conversations.json ("10x"),
+the run exits with status 1 if a stage goes over its budget.
+tests/test_memory.py checks budgets on a small generated export as part of the test run
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable
+import argparse
+import sys
+import tempfile
+import tracemalloc
+
+import port.api.props as props
+import port.chatgpt as chatgpt
+import port.helpers as helpers
+import port.unzipddp as unzipddp
+
+from benchmarks.generate import ExportSpec, generate_export, parse_size
+
+
+class BudgetExceededError(Exception):
+    """
+    One or more stages used more memory than their budget
+    """
+
+
+@dataclass
+class StageMemory:
+    stage: str
+    peak: int
+    retained: int
+
+
+def measure(stage: str, results: list[StageMemory], func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Calls func(*args, **kwargs) and appends the memory it used to results
+    """
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    out = func(*args, **kwargs)
+    after, peak = tracemalloc.get_traced_memory()
+    results.append(StageMemory(stage, peak - before, after - before))
+    return out
+
+
+def _denest_all(conversations: list[Any]) -> int:
+    # one turn at a time, like the denester path of conversations_to_df
+    n = 0
+    for conversation in conversations:
+        for turn in conversation["mapping"].values():
+            n += len(helpers.dict_denester(turn))
+    return n
+
+
+def _flatten(conversations: list[Any]) -> helpers.ColumnarBuilder:
+    builder = helpers.ColumnarBuilder(
+        chatgpt.COLUMNS,
+        categorical=["conversation title", "role", "model"],
+        converters={"time": helpers.convert_unix_timestamps},
+    )
+    for conversation in conversations:
+        for turn in conversation["mapping"].values():
+            datapoint = chatgpt.turn_to_datapoint(conversation["title"], turn)
+            if datapoint is not None:
+                builder.append(datapoint)
+    return builder
+
+
+def profile(path: str) -> list[StageMemory]:
+    """
+    Runs the extraction stage by stage, every stage keeps the output of the previous stage alive
+    """
+    # Imported on first use by the extraction, importing them inside a stage would count the modules as its memory
+    import dateutil.tz  # noqa: F401
+    import numpy  # noqa: F401
+    import pandas  # noqa: F401
+    import port.api.encoding  # noqa: F401
+
+    results: list[StageMemory] = []
+    tracemalloc.start()
+    try:
+        b = measure("zip_read", results, unzipddp.extract_file_from_zip, path, "conversations.json")
+        conversations = measure("read_json_from_bytes", results, unzipddp.read_json_from_bytes, b)
+        del b
+        measure("dict_denester", results, _denest_all, conversations)
+        builder = measure("flatten", results, _flatten, conversations)
+        del conversations
+        df = measure("dataframe_build", results, builder.to_dataframe)
+        del builder
+        measure("to_json", results, props.data_frame_to_json, df)
+        del df
+        measure("streaming_conversations_to_df", results, chatgpt.conversations_to_df, path, streaming=True)
+    finally:
+        tracemalloc.stop()
+
+    return results
+
+
+def parse_budget(budget: str, input_bytes: int) -> tuple[str, int]:
+    stage, _, limit = budget.partition("=")
+    if limit.lower().endswith("x"):
+        return stage, int(float(limit[:-1]) * input_bytes)
+    return stage, parse_size(limit)
+
+
+def check_budgets(results: list[StageMemory], budgets: dict[str, int]) -> None:
+    """
+    Raises BudgetExceededError if the peak of a stage exceeds its budget
+    """
+    stages = {r.stage for r in results}
+    unknown = set(budgets) - stages
+    if unknown:
+        raise ValueError(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+    exceeded = [
+        f"{r.stage}: peak {mb(r.peak)} > budget {mb(budgets[r.stage])}"
+        for r in results if r.stage in budgets and r.peak > budgets[r.stage]
+    ]
+    if exceeded:
+        raise BudgetExceededError("; ".join(exceeded))
+
+
+def mb(n_bytes: int) -> str:
+    return f"{n_bytes / (1 << 20):.1f}MB"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="10MB")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--export", help="profile this export instead of generating one")
+    parser.add_argument("--budget", nargs="*", default=[], help="stage=200MB or stage=10x")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.export:
+            path = Path(args.export)
+            with unzipddp.DDPArchive(str(path)) as archive:
+                input_bytes = archive.getinfo("conversations.json").file_size
+        else:
+            path = Path(tmp) / "export.zip"
+            spec = ExportSpec(size=parse_size(args.size), seed=args.seed)
+            input_bytes = generate_export(path, spec).conversations_bytes
+
+        results = profile(str(path))
+
+    print(f"conversations.json: {mb(input_bytes)}")
+    print(f"{'stage':<32} {'peak':>10} {'retained':>10} {'peak/input':>11}")
+    for r in results:
+        print(f"{r.stage:<32} {mb(r.peak):>10} {mb(r.retained):>10} {r.peak / input_bytes:>10.2f}x")
+
+    budgets = dict(parse_budget(b, input_bytes) for b in args.budget)
+    try:
+        check_budgets(results, budgets)
+    except BudgetExceededError as e:
+        print(f"Memory budget exceeded: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Cost of a byte order mark when reading json, with read_json_from_bytes and with the previous reader
+
+    python -m benchmarks.read_json --size 50MB --repeat 3
+
+The previous reader parsed with utf8 first and, when the file started with a byte order mark,
+decoded and parsed everything a second time with utf-8-sig.
+read_json_from_bytes sniffs the encoding and parses once, so the BOM case should cost the same
+"""
+from pathlib import Path
+from typing import Any, Callable
+import argparse
+import codecs
+import gc
+import io
+import json
+import tempfile
+import time
+
+import port.unzipddp as unzipddp
+
+from benchmarks.generate import ExportSpec, generate_export, parse_size
+
+
+def previous_read_json(json_bytes: bytes) -> Any:
+    # the reader before the encoding was sniffed: a full parse per encoding tried
+    for encoding in ["utf8", "utf-8-sig"]:
+        try:
+            return json.load(io.TextIOWrapper(io.BytesIO(json_bytes), encoding=encoding))
+        except json.JSONDecodeError:
+            pass
+    return {}
+
+
+def best_of(repeat: int, read: Callable[[bytes], Any], json_bytes: bytes) -> float:
+    # parsed documents are large, collect them between runs so they do not add gc time to the next run
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        read(json_bytes)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="10MB")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="report the best of this many runs")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "export.zip"
+        generate_export(path, ExportSpec(size=parse_size(args.size), seed=args.seed))
+        plain = unzipddp.extract_file_from_zip(str(path), "conversations.json").getvalue()
+    with_bom = codecs.BOM_UTF8 + plain
+
+    readers = {
+        "read_json_from_bytes": lambda b: unzipddp.read_json_from_bytes(io.BytesIO(b)),
+        "previous": previous_read_json,
+    }
+
+    print(f"conversations.json: {len(plain) / (1 << 20):.1f}MB")
+    print(f"{'reader':<24} {'no BOM':>9} {'BOM':>9} {'BOM/no BOM':>11}")
+    for name, reader in readers.items():
+        seconds_plain = best_of(args.repeat, reader, plain)
+        seconds_bom = best_of(args.repeat, reader, with_bom)
+        print(f"{name:<24} {seconds_plain:>8.3f}s {seconds_bom:>8.3f}s {seconds_bom / seconds_plain:>10.2f}x")
+
+
+if __name__ == "__main__":
+    main()
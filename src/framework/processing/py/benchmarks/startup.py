@@ -0,0 +1,81 @@
+"""
+Startup cost of the port package: time until the file prompt is rendered and the modules loaded by then
+
+    python -m benchmarks.startup --repeat 5
+
+Every measurement runs in a fresh interpreter, like a new Pyodide worker.
+The file prompt should render without pandas, numpy and multiprocessing,
+the run exits with status 1 if any of them is loaded before it
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+
+# Modules that should only be loaded once a file is extracted
+HEAVY_MODULES = ["pandas", "numpy", "dateutil", "multiprocessing"]
+
+_PROBE = """
+import json, sys, time
+
+t0 = time.perf_counter()
+import port
+t1 = time.perf_counter()
+
+script = port.start("benchmark")
+command = script.send(None)
+while command["__type__"] != "CommandUIRender":
+    command = script.send(None)
+assert command["page"]["body"]["__type__"] == "PropsUIPromptFileInput"
+t2 = time.perf_counter()
+loaded = [m for m in HEAVY_MODULES if m in sys.modules]
+n_modules = len(sys.modules)
+
+import pandas
+t3 = time.perf_counter()
+
+print(json.dumps({
+    "import_port": t1 - t0,
+    "file_prompt": t2 - t0,
+    "import_pandas": t3 - t2,
+    "loaded": loaded,
+    "n_modules": n_modules,
+}))
+"""
+
+
+def probe() -> dict:
+    code = f"HEAVY_MODULES = {HEAVY_MODULES!r}\n{_PROBE}"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(out.stdout)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print the results as json")
+    args = parser.parse_args()
+
+    results = [probe() for _ in range(args.repeat)]
+    summary = {
+        stage: statistics.median(r[stage] for r in results)
+        for stage in ("import_port", "file_prompt", "import_pandas")
+    }
+    loaded = sorted({m for r in results for m in r["loaded"]})
+
+    if args.json:
+        print(json.dumps({**summary, "loaded": loaded, "n_modules": results[0]["n_modules"]}))
+    else:
+        for stage, seconds in summary.items():
+            print(f"{stage:<16} {seconds * 1000:8.1f}ms (median of {args.repeat})")
+        print(f"modules loaded at the file prompt: {results[0]['n_modules']}")
+
+    if loaded:
+        print(f"Loaded before the file prompt: {', '.join(loaded)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Throughput of the stages of the ChatGPT extraction on generated exports
+
+    python -m benchmarks.throughput --sizes 1MB 10MB 100MB --repeat 3
+
+Every stage is timed separately: validate_zip, conversations_to_df, extract_chatgpt
+and PropsUIPromptConsentForm.toDict. MB/s is relative to the size of conversations.json,
+rows/s to the number of turns the consent form shows (script.TRAVERSAL)
+"""
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Any, Callable
+import argparse
+import json
+import tempfile
+import time
+
+import port.api.props as props
+import port.chatgpt as chatgpt
+import port.helpers as helpers
+import port.script as script
+
+from benchmarks.generate import ExportSpec, GeneratedExport, generate_export, parse_size
+
+
+@dataclass
+class StageResult:
+    size: str
+    stage: str
+    seconds: float
+    rows: int
+    rows_per_second: float
+    mb_per_second: float
+
+
+def export_path(workdir: Path, size: str, seed: int) -> Path:
+    return workdir / f"chatgpt-{size}-{seed}.zip"
+
+
+def get_export(workdir: Path, size: str, seed: int) -> GeneratedExport:
+    """
+    Generates an export, or reuses the one generated by an earlier run
+    """
+    path = export_path(workdir, size, seed)
+    spec = ExportSpec(size=parse_size(size), seed=seed)
+    if path.exists():
+        return GeneratedExport(path, -1, spec.size)
+    return generate_export(path, spec)
+
+
+def best_of(repeat: int, stage: Callable[[], Any]) -> tuple[float, Any]:
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = stage()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run(size: str, workdir: Path, seed: int = 0, repeat: int = 1, workers: int | None = 1) -> list[StageResult]:
+    # Imported by the first stage that builds a DataFrame otherwise, that stage would be charged for the import
+    helpers.import_pandas()
+
+    export = get_export(workdir, size, seed)
+    path = str(export.path)
+    mb = export.conversations_bytes / (1 << 20)
+
+    # the turns extract_chatgpt shows, so every stage processes the same rows
+    seconds, df = best_of(
+        repeat,
+        lambda: chatgpt.conversations_to_df(path, streaming=True, workers=workers, traversal=script.TRAVERSAL),
+    )
+    rows = len(df)
+    timings = [("conversations_to_df", seconds)]
+
+    seconds, _ = best_of(repeat, lambda: chatgpt.validate_zip(path))
+    timings.insert(0, ("validate_zip", seconds))
+
+    seconds, tables = best_of(repeat, lambda: script.extract_chatgpt(path))
+    timings.append(("extract_chatgpt", seconds))
+
+    consent_form = props.PropsUIPromptConsentForm(tables, meta_tables=[])
+    seconds, _ = best_of(repeat, consent_form.toDict)
+    timings.append(("PropsUIPromptConsentForm.toDict", seconds))
+
+    return [
+        StageResult(size, stage, seconds, rows, rows / seconds if seconds else 0.0, mb / seconds if seconds else 0.0)
+        for stage, seconds in timings
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["1MB", "10MB"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="report the best of this many runs")
+    parser.add_argument("--workers", type=int, default=1, help="processes for conversations_to_df, 0 for all cores")
+    parser.add_argument("--workdir", help="directory to keep generated exports in, defaults to a temporary directory")
+    parser.add_argument("--json", action="store_true", help="print results as json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(args.workdir or tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        results = [r for size in args.sizes for r in run(size, workdir, args.seed, args.repeat, args.workers or None)]
+
+    if args.json:
+        print(json.dumps([asdict(r) for r in results], indent=2))
+        return
+
+    print(f"{'size':>8} {'stage':<32} {'seconds':>9} {'rows':>9} {'rows/s':>11} {'MB/s':>8}")
+    for r in results:
+        print(
+            f"{r.size:>8} {r.stage:<32} {r.seconds:>9.3f} {r.rows:>9} "
+            f"{r.rows_per_second:>11.0f} {r.mb_per_second:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
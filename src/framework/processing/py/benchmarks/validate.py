@@ -0,0 +1,87 @@
+"""
+Cost of ValidateInput.infer_ddp_category with many categories and many files in a zip
+
+    python -m benchmarks.validate --categories 10 100 500 --files 5000
+
+Synthetic categories with known_files of 20 names and paths each are matched against
+a list of paths of which one category is present. The previous implementation,
+a membership test in every list of known files for every file, is timed for comparison
+"""
+import argparse
+import random
+import time
+
+from port.validate import DDPCategory, DDPFiletype, Language, StatusCode, ValidateInput
+
+KNOWN_FILES_PER_CATEGORY = 20
+
+
+def make_categories(n: int) -> list[DDPCategory]:
+    return [
+        DDPCategory(
+            id=f"platform-{i}",
+            ddp_filetype=DDPFiletype.JSON,
+            language=Language.EN,
+            known_files=[
+                f"platform-{i}/activity/file-{j}.json" if j % 2 else f"file-{i}-{j}.json"
+                for j in range(KNOWN_FILES_PER_CATEGORY)
+            ],
+        )
+        for i in range(n)
+    ]
+
+
+def make_paths(categories: list[DDPCategory], n_files: int, seed: int) -> list[str]:
+    """
+    Half of the known files of one category between n_files unknown files
+    """
+    rng = random.Random(seed)
+    present = rng.choice(categories)
+    paths = [f"export/data/other-{k}.json" for k in range(n_files)]
+    for known_file in present.known_files[::2]:
+        paths.insert(rng.randrange(len(paths) + 1), f"export/{known_file}")
+    return paths
+
+
+def previous_infer(categories: list[DDPCategory], file_list_input: list[str]) -> str | None:
+    names = [path.rsplit("/", 1)[-1] for path in file_list_input]
+    prop_category = {}
+    for category in categories:
+        n_files_found = [1 if f in category.known_files else 0 for f in names]
+        prop_category[category.id] = sum(n_files_found) / len(category.known_files) * 100
+    highest = max(prop_category, key=prop_category.get)  # type: ignore
+    return highest if prop_category[highest] >= 5 else None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--categories", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    status_codes = [StatusCode(0, "Valid zip", "Valid zip"), StatusCode(1, "Bad zipfile", "Bad zipfile")]
+
+    print(f"{'categories':>10} {'files':>7} {'index build':>12} {'index':>10} {'previous':>10}")
+    for n in args.categories:
+        categories = make_categories(n)
+        paths = make_paths(categories, args.files, args.seed)
+
+        start = time.perf_counter()
+        ValidateInput(status_codes, categories)
+        build = time.perf_counter() - start
+
+        validate = ValidateInput(status_codes, categories)
+        start = time.perf_counter()
+        validate.infer_ddp_category(paths)
+        indexed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        previous_infer(categories, paths)
+        previous = time.perf_counter() - start
+
+        print(f"{n:>10} {len(paths):>7} {build * 1000:>10.1f}ms {indexed * 1000:>8.1f}ms {previous * 1000:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
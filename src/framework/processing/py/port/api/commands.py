@@ -1,3 +1,10 @@
+from typing import Iterable, Iterator
+import base64
+import gzip
+import hashlib
+import json
+
+
 class CommandUIRender:
     __slots__ = "page"
 
@@ -11,6 +18,38 @@ class CommandUIRender:
         return dict
 
 
+class CommandUITablePage:
+    """
+    Reply to a page request of the host for a paged consent form table
+    """
+    __slots__ = "table_page"
+
+    def __init__(self, table_page):
+        self.table_page = table_page
+
+    def toDict(self):
+        dict = {}
+        dict["__type__"] = "CommandUITablePage"
+        dict["table_page"] = self.table_page.toDict()
+        return dict
+
+
+class CommandUITableAppend:
+    """
+    Rows for a consent form table that is still being extracted, see script.render_progressive_consent_form
+    """
+    __slots__ = "table_append"
+
+    def __init__(self, table_append):
+        self.table_append = table_append
+
+    def toDict(self):
+        dict = {}
+        dict["__type__"] = "CommandUITableAppend"
+        dict["table_append"] = self.table_append.toDict()
+        return dict
+
+
 class CommandSystemDonate:
     __slots__ = "key", "json_string"
 
@@ -39,3 +78,88 @@ class CommandSystemExit:
         dict["code"] = self.code
         dict["info"] = self.info
         return dict
+
+
+# Encodings of the data of a donation chunk
+CHUNK_ENCODING_TEXT = "utf-8"
+CHUNK_ENCODING_GZIP = "gzip+base64"
+
+
+def _split_utf8(data: bytes, chunk_size: int) -> Iterator[bytes]:
+    """
+    Splits utf-8 encoded bytes in parts of at most chunk_size bytes, without splitting a character
+    """
+    start = 0
+    while start < len(data):
+        end = min(start + chunk_size, len(data))
+        # step back while the first byte of the next part is a continuation byte
+        while end < len(data) and data[end] & 0xC0 == 0x80:
+            end -= 1
+        if end == start:
+            # a single character does not fit in chunk_size, take it whole
+            end += 1
+            while end < len(data) and data[end] & 0xC0 == 0x80:
+                end += 1
+        yield data[start:end]
+        start = end
+
+
+def split_donation(key, json_string, chunk_size=1 << 20, compress=False) -> list[CommandSystemDonate]:
+    """
+    Splits a donation in a series of CommandSystemDonate commands that can be send and retried individually
+
+    Every chunk is donated under the key "<key>-chunk-<sequence>" and its json_string is an envelope:
+    {
+        "__type__": "DonationChunk", "key": <key>, "sequence": <0 based>, "total": <number of chunks>,
+        "encoding": "utf-8" or "gzip+base64", "sha256": <hex digest of the uncompressed chunk>, "data": <chunk>
+    }
+    chunk_size limits the number of uncompressed bytes per chunk, see join_donation to reassemble
+    """
+    parts = list(_split_utf8(json_string.encode("utf-8"), chunk_size)) or [b""]
+
+    commands = []
+    for sequence, part in enumerate(parts):
+        if compress:
+            encoding = CHUNK_ENCODING_GZIP
+            data = base64.b64encode(gzip.compress(part)).decode("ascii")
+        else:
+            encoding = CHUNK_ENCODING_TEXT
+            data = part.decode("utf-8")
+
+        envelope = {
+            "__type__": "DonationChunk",
+            "key": key,
+            "sequence": sequence,
+            "total": len(parts),
+            "encoding": encoding,
+            "sha256": hashlib.sha256(part).hexdigest(),
+            "data": data,
+        }
+        commands.append(CommandSystemDonate(f"{key}-chunk-{sequence}", json.dumps(envelope)))
+
+    return commands
+
+
+def join_donation(chunk_json_strings: Iterable[str]) -> str:
+    """
+    Reassembles the json_string of a donation from its chunks, in any order
+    Raises ValueError if a chunk is missing or does not match its checksum
+    """
+    chunks = [json.loads(c) for c in chunk_json_strings]
+    chunks.sort(key=lambda chunk: chunk["sequence"])
+
+    if not chunks or [c["sequence"] for c in chunks] != list(range(chunks[0]["total"])):
+        raise ValueError("Donation is incomplete")
+
+    parts = []
+    for chunk in chunks:
+        if chunk["encoding"] == CHUNK_ENCODING_GZIP:
+            part = gzip.decompress(base64.b64decode(chunk["data"]))
+        else:
+            part = chunk["data"].encode("utf-8")
+
+        if hashlib.sha256(part).hexdigest() != chunk["sha256"]:
+            raise ValueError(f"Checksum mismatch in chunk {chunk['sequence']} of {chunk['key']}")
+        parts.append(part)
+
+    return b"".join(parts).decode("utf-8")
@@ -0,0 +1,123 @@
+"""
+Compact wire format for consent form tables
+
+The default format of a table is the output of DataFrame.to_json(),
+which repeats the row index for every column and every value of every row.
+The columnar format is opt-in and looks like this:
+
+    {
+        "format": "columnar-v1",
+        "num_rows": 3,
+        "columns": [
+            {"name": "role", "dictionary": ["user", "assistant"], "codes": [0, 1, 0]},
+            {"name": "message", "values": ["Hi", "Hello!", null]}
+        ]
+    }
+
+Decode contract for the host:
+  * Rows are numbered 0 to num_rows - 1, there is no index
+  * A column has either "values": the value of every row,
+    or "dictionary" and "codes": the value of a row is dictionary[code], code -1 means null
+  * datetime columns are send as formatted strings, just like in the default format
+
+decode_columnar is the reference implementation
+"""
+
+from typing import TYPE_CHECKING, Any
+import json
+
+import port.helpers as helpers
+from port.api.table import CATEGORY, Table
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+COLUMNAR = "columnar-v1"
+
+# Object columns are dictionary encoded when they contain at most this share of distinct values
+DICTIONARY_RATIO = 0.5
+
+
+def _to_list(series: "pd.Series") -> list[Any]:
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def _encode_column(name: str, series: "pd.Series") -> dict[str, Any]:
+    import pandas as pd
+
+    if pd.api.types.is_datetime64_any_dtype(series):
+        series = helpers.format_datetimes(series)
+
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return {
+            "name": name,
+            "dictionary": _to_list(pd.Series(series.cat.categories)),
+            "codes": series.cat.codes.tolist(),
+        }
+
+    if series.dtype == object:
+        try:
+            codes, uniques = pd.factorize(series)
+            if len(uniques) <= len(series) * DICTIONARY_RATIO:
+                return {"name": name, "dictionary": _to_list(pd.Series(uniques)), "codes": codes.tolist()}
+        except TypeError:
+            # unhashable values, send them as is
+            pass
+
+    return {"name": name, "values": _to_list(series)}
+
+
+def _encode_table_column(name: str, table: Table) -> dict[str, Any]:
+    values = table.display_values(name)
+    is_category = table.dtypes[name] == CATEGORY
+
+    try:
+        dictionary: dict[Any, int] = {}
+        codes = []
+        for value in values:
+            if value is None:
+                codes.append(-1)
+                continue
+            code = dictionary.get(value)
+            if code is None:
+                code = dictionary[value] = len(dictionary)
+            codes.append(code)
+        if is_category or len(dictionary) <= len(values) * DICTIONARY_RATIO:
+            return {"name": name, "dictionary": list(dictionary), "codes": codes}
+    except TypeError:
+        # unhashable values, send them as is
+        pass
+
+    return {"name": name, "values": values}
+
+
+def encode_columnar(data_frame: "pd.DataFrame | Table") -> str:
+    """
+    Serializes a table in the columnar format, see module docstring
+    """
+    if isinstance(data_frame, Table):
+        columns = [_encode_table_column(name, data_frame) for name in data_frame.columns]
+    else:
+        columns = [_encode_column(str(name), series) for name, series in data_frame.items()]
+
+    out = {
+        "format": COLUMNAR,
+        "num_rows": len(data_frame),
+        "columns": columns,
+    }
+    return json.dumps(out, separators=(",", ":"), default=str)
+
+
+def decode_columnar(json_string: str) -> dict[str, list[Any]]:
+    """
+    Decodes the columnar format to a list of values per column
+    """
+    table = json.loads(json_string)
+    out = {}
+    for column in table["columns"]:
+        if "dictionary" in column:
+            dictionary = column["dictionary"]
+            out[column["name"]] = [dictionary[code] if code >= 0 else None for code in column["codes"]]
+        else:
+            out[column["name"]] = column["values"]
+    return out
@@ -1,7 +1,13 @@
 from dataclasses import dataclass
-from typing import Optional, TypedDict
+from typing import TYPE_CHECKING, Optional, TypedDict
 
-import pandas as pd
+import port.helpers as helpers
+import port.tracking as tracking
+from port.api.table import Table
+
+# pandas is imported on first use, so the pages before the extraction render without it
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 class Translations(TypedDict):
@@ -83,33 +89,167 @@ class PropsUIPromptConfirm:
         return dict
 
 
+def data_frame_to_json(data_frame: "pd.DataFrame | Table", data_format: Optional[str] = None) -> str:
+    """
+    Serializes a table to be shown in the consent form
+    datetime columns are shown as formatted strings instead of epoch milliseconds,
+    missing datetimes as empty strings
+
+    By default the table is serialized with DataFrame.to_json,
+    with data_format=encoding.COLUMNAR the compact format in port.api.encoding is used
+    A port.api.table.Table is serialized the same way, without pandas
+    """
+    import port.api.encoding as encoding
+
+    if data_format == encoding.COLUMNAR:
+        return encoding.encode_columnar(data_frame)
+
+    if isinstance(data_frame, Table):
+        return data_frame.to_json()
+
+    datetime_columns = data_frame.select_dtypes(include="datetime").columns
+    if len(datetime_columns) > 0:
+        data_frame = data_frame.copy(deep=False)
+        for column in datetime_columns:
+            data_frame[column] = helpers.format_datetimes(data_frame[column])
+
+    return data_frame.to_json()
+
+
+@dataclass
+class PropsUITablePage:
+    """One page of a paged consent form table
+
+    Send to the host in reply to a page request, see PropsUIPromptConsentFormTable
+
+    Attributes:
+        table_id: id of the table the page belongs to
+        page: number of the page, starting at 0
+        page_size: maximum number of rows on a page
+        total_rows: number of rows in the complete table
+        data_frame: rows on this page
+        data_format: optional wire format of data_frame, see data_frame_to_json
+    """
+
+    table_id: str
+    page: int
+    page_size: int
+    total_rows: int
+    data_frame: "pd.DataFrame | Table"
+    data_format: Optional[str] = None
+
+    def toDict(self):
+        dict = {}
+        dict["__type__"] = "PropsUITablePage"
+        dict["table_id"] = self.table_id
+        dict["page"] = self.page
+        dict["page_size"] = self.page_size
+        dict["total_rows"] = self.total_rows
+        dict["data_frame"] = data_frame_to_json(self.data_frame, self.data_format)
+        dict["data_format"] = self.data_format
+        return dict
+
+
+@dataclass
+class PropsUITableAppend:
+    """Rows to append to a consent form table that is still being extracted
+
+    Send to the host while the table is pending, see PropsUIPromptConsentFormTable
+
+    Attributes:
+        table_id: id of the table the rows belong to
+        offset: number of rows the table had before these, the first row of data_frame gets this number
+        data_frame: rows to append, numbered from 0
+        pending: true if more rows will follow
+        data_format: optional wire format of data_frame, see data_frame_to_json
+        visualizations: optional visualizations that replace those of the table
+    """
+
+    table_id: str
+    offset: int
+    data_frame: "pd.DataFrame | Table"
+    pending: bool
+    data_format: Optional[str] = None
+    visualizations: Optional[list] = None
+
+    def toDict(self):
+        dict = {}
+        dict["__type__"] = "PropsUITableAppend"
+        dict["table_id"] = self.table_id
+        dict["offset"] = self.offset
+        dict["data_frame"] = data_frame_to_json(self.data_frame, self.data_format)
+        dict["data_format"] = self.data_format
+        dict["pending"] = self.pending
+        dict["visualizations"] = self.visualizations
+        return dict
+
+
 @dataclass
 class PropsUIPromptConsentFormTable:
     """Table to be shown to the participant prior to donation
 
+    When page_size is set, only the first page of the table is send to the host
+    together with the total number of rows and the schema of the table.
+    The host can then request the other pages, see script.render_table_page
+
     Attributes:
         id: a unique string to itentify the table after donation
         title: title of the table
-        data_frame: table to be shown
+        data_frame: table to be shown, a DataFrame or a port.api.table.Table
         visualizations: optional visualizations to be shown. (see TODO for input format)
+        page_size: optional number of rows per page
+        data_format: optional wire format of data_frame, see data_frame_to_json
+        pending: true while rows are still being extracted, they follow in PropsUITableAppend
     """
 
     id: str
     title: Translatable
-    data_frame: pd.DataFrame
+    data_frame: "pd.DataFrame | Table"
     description: Optional[Translatable] = None
     visualizations: Optional[list] = None
     folded: Optional[bool] = False
+    page_size: Optional[int] = None
+    data_format: Optional[str] = None
+    pending: bool = False
+
+    def get_page(self, page: int) -> PropsUITablePage:
+        """
+        Slices a page from the table, rows are numbered from 0 within the page
+        Pages past the end, and negative pages, are empty
+        """
+        page_size = self.page_size or max(1, len(self.data_frame))
+        pages = helpers.split_dataframe(self.data_frame, page_size)
+        if 0 <= page < len(pages):
+            data_frame = pages[page]
+        else:
+            data_frame = self.data_frame[0:0] if not isinstance(self.data_frame, Table) else self.data_frame.slice(0, 0)
+        if not isinstance(data_frame, Table):
+            data_frame = data_frame.reset_index(drop=True)
+        return PropsUITablePage(self.id, page, page_size, len(self.data_frame), data_frame, self.data_format)
+
+    def schema(self) -> list[dict[str, str]]:
+        return [
+            {"name": str(column), "dtype": str(dtype)}
+            for column, dtype in self.data_frame.dtypes.items()
+        ]
 
     def toDict(self):
         dict = {}
         dict["__type__"] = "PropsUIPromptConsentFormTable"
         dict["id"] = self.id
         dict["title"] = self.title.toDict()
-        dict["data_frame"] = self.data_frame.to_json()
+        if self.page_size:
+            dict["data_frame"] = data_frame_to_json(self.get_page(0).data_frame, self.data_format)
+            dict["page_size"] = self.page_size
+            dict["total_rows"] = len(self.data_frame)
+            dict["schema"] = self.schema()
+        else:
+            dict["data_frame"] = data_frame_to_json(self.data_frame, self.data_format)
+        dict["data_format"] = self.data_format
         dict["description"] = self.description.toDict() if self.description else None
         dict["visualizations"] = self.visualizations if self.visualizations else None
         dict["folded"] = self.folded
+        dict["pending"] = self.pending
         return dict
 
 
@@ -141,10 +281,15 @@ class PropsUIPromptConsentForm:
         return output
 
     def toDict(self):
+        with tracking.span("props.consent_form_to_dict") as span:
+            span.rows = sum(len(table.data_frame) for table in self.tables + self.meta_tables)
+            tables = self.translate_tables()
+            meta_tables = self.translate_meta_tables()
+
         dict = {}
         dict["__type__"] = "PropsUIPromptConsentForm"
-        dict["tables"] = self.translate_tables()
-        dict["metaTables"] = self.translate_meta_tables()
+        dict["tables"] = tables
+        dict["metaTables"] = meta_tables
         dict["description"] = self.description and self.description.toDict()
         dict["donateQuestion"] = self.donate_question and self.donate_question.toDict()
         dict["donateButton"] = self.donate_button and self.donate_button.toDict()
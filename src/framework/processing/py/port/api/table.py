@@ -0,0 +1,170 @@
+"""
+Minimal columnar table, an alternative to pandas DataFrames for consent form tables
+
+A Table stores a list of values per column and a dtype per column.
+It supports what the consent form needs: row slicing, filtering and serialization
+in the same format as DataFrame.to_json(), so the host does not see the difference.
+
+pandas is optional: to_pandas and from_pandas import it when they are called
+"""
+
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Callable, Iterator
+import json
+import math
+
+from port.helpers import DATETIME_FORMAT
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# dtypes of a Table column, any other dtype is treated as OBJECT
+OBJECT = "object"
+CATEGORY = "category"
+DATETIME = "datetime"
+
+
+def _format_datetimes(values: list[Any]) -> list[str]:
+    # like helpers.format_datetimes, missing values become empty strings
+    return [v.strftime(DATETIME_FORMAT) if isinstance(v, datetime) else "" for v in values]
+
+
+def _json_value(value: Any) -> Any:
+    # NaN is not valid json, DataFrame.to_json sends null
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+class Table:
+    """
+    Table with column storage
+
+    Args:
+        data: values per column, all columns need the same number of values
+        dtypes: optional dtype per column, see OBJECT, CATEGORY and DATETIME
+
+    Example:
+        table = Table({"role": ["user", "assistant"], "message": ["Hi", "Hello!"]})
+        table.filter(lambda row: row["role"] == "user").to_json()
+    """
+
+    def __init__(self, data: dict[str, list[Any]] | None = None, dtypes: dict[str, str] | None = None):
+        self._data = {str(column): list(values) for column, values in (data or {}).items()}
+        self._dtypes = {column: (dtypes or {}).get(column, OBJECT) for column in self._data}
+
+        lengths = {len(values) for values in self._data.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"Columns have different lengths: {sorted(lengths)}")
+        self._n_rows = lengths.pop() if lengths else 0
+
+    @classmethod
+    def from_rows(cls, rows: list[dict[str, Any]], columns: list[str], dtypes: dict[str, str] | None = None) -> "Table":
+        """
+        Builds a table from a list of row dicts, missing keys become None
+        """
+        return cls({column: [row.get(column) for row in rows] for column in columns}, dtypes)
+
+    @classmethod
+    def from_pandas(cls, data_frame: "pd.DataFrame") -> "Table":
+        import pandas as pd
+
+        data = {}
+        dtypes = {}
+        for column, series in data_frame.items():
+            column = str(column)
+            if pd.api.types.is_datetime64_any_dtype(series):
+                dtypes[column] = DATETIME
+                data[column] = [None if v is pd.NaT else v.to_pydatetime() for v in series]
+                continue
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                dtypes[column] = CATEGORY
+            data[column] = series.astype(object).where(series.notna(), None).tolist()
+        return cls(data, dtypes)
+
+    def to_pandas(self) -> "pd.DataFrame":
+        import pandas as pd
+
+        if not self._data:
+            return pd.DataFrame()
+
+        data = {}
+        for column, values in self._data.items():
+            dtype = self._dtypes[column]
+            if dtype == CATEGORY:
+                data[column] = pd.Categorical(values)
+            elif dtype == DATETIME:
+                data[column] = pd.to_datetime(values)
+            else:
+                data[column] = values
+        return pd.DataFrame(data, columns=self.columns)
+
+    @property
+    def columns(self) -> list[str]:
+        return list(self._data)
+
+    @property
+    def dtypes(self) -> dict[str, str]:
+        return dict(self._dtypes)
+
+    @property
+    def empty(self) -> bool:
+        return self._n_rows == 0 or not self._data
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self._n_rows, len(self._data)
+
+    def __len__(self) -> int:
+        return self._n_rows
+
+    def __getitem__(self, column: str) -> list[Any]:
+        return self._data[column]
+
+    def __repr__(self) -> str:
+        return f"Table(columns={self.columns}, rows={self._n_rows})"
+
+    def _with_data(self, data: dict[str, list[Any]]) -> "Table":
+        return Table(data, self._dtypes)
+
+    def slice(self, start: int, stop: int | None = None) -> "Table":
+        """
+        Rows start up to stop, like table.iloc[start:stop] on a DataFrame
+        """
+        return self._with_data({column: values[start:stop] for column, values in self._data.items()})
+
+    def take(self, indices: list[int]) -> "Table":
+        """
+        Rows at the given positions, in the given order
+        """
+        return self._with_data({column: [values[i] for i in indices] for column, values in self._data.items()})
+
+    def filter(self, predicate: Callable[[dict[str, Any]], bool]) -> "Table":
+        """
+        Rows for which predicate(row) is true, row is a dict of column to value
+        """
+        return self.take([i for i, row in enumerate(self.rows()) if predicate(row)])
+
+    def rows(self) -> Iterator[dict[str, Any]]:
+        columns = self.columns
+        for values in zip(*self._data.values()):
+            yield dict(zip(columns, values))
+
+    def display_values(self, column: str) -> list[Any]:
+        """
+        Values of a column as they are send to the host, datetimes are formatted
+        """
+        values = self._data[column]
+        if self._dtypes[column] == DATETIME:
+            return _format_datetimes(values)
+        return values
+
+    def to_json(self) -> str:
+        """
+        Serializes the table in the format of DataFrame.to_json(): {column: {row number: value}}
+        """
+        out = {
+            column: {str(i): _json_value(value) for i, value in enumerate(self.display_values(column))}
+            for column in self._data
+        }
+        return json.dumps(out, default=str)
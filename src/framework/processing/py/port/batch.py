@@ -0,0 +1,315 @@
+"""
+Headless runner of the donation flow, to reprocess exports in bulk or to load test the flow
+
+    python -m port.batch exports/*.zip --out donations --workers 4
+
+Every export is a session: port.start(session_id) is driven like the host would,
+render commands are answered with scripted payloads (the file, consent, retry)
+and every donation is written to <out>/<session_id>/<key>.json.
+At the end the number of sessions per second and the latency per session are reported
+"""
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+import argparse
+import contextlib
+import io
+import json
+import logging
+import statistics
+import time
+
+import port.api.encoding as encoding
+import port.cache as cache
+import port.script as script
+import port.tracking as tracking
+from port.main import start
+
+logger = logging.getLogger(__name__)
+
+
+class Payload:
+    """
+    Answer to a command, like the payloads the host sends: __type__ and value
+    """
+
+    def __init__(self, type: str, value: Any = None):
+        self.__type__ = type
+        self.value = value
+
+    def __repr__(self) -> str:
+        return f"Payload({self.__type__!r})"
+
+
+@dataclass
+class Answers:
+    """
+    What the simulated participant does
+
+    Attributes:
+        consent: donate the data on the consent form, otherwise decline
+        retries: number of times "Try again" is pressed when the file is not valid
+        fetch_pages: request every page of a paged consent table before donating
+    """
+
+    consent: bool = True
+    retries: int = 0
+    fetch_pages: bool = True
+
+
+@dataclass
+class SessionResult:
+    session_id: str
+    path: str
+    seconds: float = 0.0
+    n_commands: int = 0
+    donations: list[str] = field(default_factory=list)
+    donated_bytes: int = 0
+    exit_code: int | None = None
+    error: str | None = None
+
+
+def _table_rows(data_frame: str, data_format: str | None) -> list[dict[str, str]]:
+    """
+    Rows of a serialized consent table as the host shows them: every value as a string
+    """
+    if data_format == encoding.COLUMNAR:
+        columns = encoding.decode_columnar(data_frame)
+    else:
+        columns = {
+            name: [values[key] for key in sorted(values, key=int)]
+            for name, values in json.loads(data_frame).items()
+        }
+
+    if not columns:
+        return []
+    n_rows = len(next(iter(columns.values())))
+    return [{name: str(values[i]) for name, values in columns.items()} for i in range(n_rows)]
+
+
+class Session:
+    """
+    One run of the donation flow on one export
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        path: str,
+        out: Path | None = None,
+        answers: Answers | None = None,
+        cache_directory: str | None = None,
+    ):
+        self.result = SessionResult(session_id, path)
+        self.cache_directory = cache_directory
+        self.out = out / session_id if out is not None else None
+        self.answers = answers or Answers()
+        self.retries_left = self.answers.retries
+        self.files_given = 0
+        self.pending_pages: list[tuple[str, int]] = []
+        self.tables: dict[str, list[dict[str, str]]] = {}
+        self.pending_tables: set[str] = set()
+
+    def donate(self, key: str, json_string: str) -> None:
+        self.result.donations.append(key)
+        self.result.donated_bytes += len(json_string)
+        if self.out is not None:
+            self.out.mkdir(parents=True, exist_ok=True)
+            (self.out / f"{key.replace('/', '_')}.json").write_text(json_string, encoding="utf-8")
+
+    def consent_payload(self) -> Payload:
+        if not self.answers.consent:
+            return Payload("PayloadFalse", False)
+        # Same shape as serializeConsentData in consent_form.tsx
+        data: list[Any] = [{table_id: rows} for table_id, rows in self.tables.items()]
+        data.append({"user_omissions": json.dumps([])})
+        return Payload("PayloadJSON", json.dumps(data))
+
+    def next_page_or_consent(self) -> Payload:
+        if self.pending_pages:
+            table_id, page = self.pending_pages.pop(0)
+            return Payload("PayloadTablePageRequest", json.dumps({"table_id": table_id, "page": page}))
+        return self.consent_payload()
+
+    def read_consent_form(self, body: dict[str, Any]) -> None:
+        self.tables = {}
+        self.pending_pages = []
+        self.pending_tables = set()
+        for table in body.get("tables", []):
+            self.tables[table["id"]] = _table_rows(table["data_frame"], table.get("data_format"))
+            if table.get("pending"):
+                self.pending_tables.add(table["id"])
+            page_size = table.get("page_size")
+            if page_size and self.answers.fetch_pages:
+                n_pages = -(-table["total_rows"] // page_size)
+                self.pending_pages.extend((table["id"], page) for page in range(1, n_pages))
+
+    def answer(self, command: dict[str, Any]) -> Payload:
+        """
+        Payload the simulated participant or host sends in reply to a command
+        """
+        kind = command["__type__"]
+
+        if kind == "CommandSystemDonate":
+            self.donate(command["key"], command["json_string"])
+            return Payload("PayloadVoid")
+
+        if kind == "CommandUITablePage":
+            table_page = command["table_page"]
+            rows = _table_rows(table_page["data_frame"], table_page.get("data_format"))
+            self.tables[table_page["table_id"]].extend(rows)
+            return self.next_page_or_consent()
+
+        if kind == "CommandUITableAppend":
+            # the participant waits for all rows of a pending table before donating
+            table_append = command["table_append"]
+            rows = _table_rows(table_append["data_frame"], table_append.get("data_format"))
+            self.tables[table_append["table_id"]].extend(rows)
+            if not table_append["pending"]:
+                self.pending_tables.discard(table_append["table_id"])
+            return Payload("PayloadVoid") if self.pending_tables else self.next_page_or_consent()
+
+        if kind != "CommandUIRender":
+            return Payload("PayloadVoid")
+
+        body = command["page"].get("body") or {}
+        prompt = body.get("__type__")
+
+        if prompt == "PropsUIPromptFileInput":
+            # the file is given once, and once more for every retry
+            if self.files_given > self.answers.retries:
+                return Payload("PayloadFalse", False)
+            self.files_given += 1
+            return Payload("PayloadString", self.result.path)
+
+        if prompt == "PropsUIPromptConfirm":
+            if self.retries_left > 0:
+                self.retries_left -= 1
+                return Payload("PayloadTrue", True)
+            return Payload("PayloadFalse", False)
+
+        if prompt == "PropsUIPromptConsentForm":
+            self.read_consent_form(body)
+            return Payload("PayloadVoid") if self.pending_tables else self.next_page_or_consent()
+
+        return Payload("PayloadVoid")
+
+    def run(self) -> SessionResult:
+        # Module level state of the script outlives a session when several run in one process
+        script.LOG_HANDLER.reset()
+        tracking.TIMINGS.reset()
+        # Like a page load: the memory cache starts empty, results can only come from the cache directory
+        script.CACHE_DIRECTORY = self.cache_directory
+        script.EXTRACTION_CACHE = (
+            cache.ExtractionCache(max_entries=2, directory=self.cache_directory) if self.cache_directory else None
+        )
+
+        start_time = time.perf_counter()
+        try:
+            # script prints to stdout, keep it out of the report
+            with contextlib.redirect_stdout(io.StringIO()):
+                flow = start(self.result.session_id)
+                command = flow.send(None)
+                while True:
+                    self.result.n_commands += 1
+                    if command["__type__"] == "CommandSystemExit":
+                        self.result.exit_code = command["code"]
+                        break
+                    command = flow.send(self.answer(command))
+        except Exception as e:
+            logger.error("Session %s failed: %s", self.result.session_id, e)
+            self.result.error = repr(e)
+
+        self.result.seconds = time.perf_counter() - start_time
+        return self.result
+
+
+def run_session(
+    session_id: str,
+    path: str,
+    out: Path | None = None,
+    answers: Answers | None = None,
+    cache_directory: str | None = None,
+) -> SessionResult:
+    return Session(session_id, path, out, answers, cache_directory).run()
+
+
+def _run_session_args(args: tuple[str, str, Path | None, Answers | None, str | None]) -> SessionResult:
+    return run_session(*args)
+
+
+def run_batch(
+    paths: list[str],
+    out: Path | None = None,
+    workers: int | None = 1,
+    answers: Answers | None = None,
+    repeat: int = 1,
+    cache_directory: str | None = None,
+) -> list[SessionResult]:
+    """
+    Runs a session per export (repeat times), in a process pool when workers is not 1
+    Results are in the order of the exports
+
+    Sessions only share extraction results through cache_directory, see script.CACHE_DIRECTORY
+    """
+    sessions = [
+        (f"{Path(path).stem}-{i}-{n}", str(path), out, answers, cache_directory)
+        for n in range(repeat)
+        for i, path in enumerate(paths)
+    ]
+
+    if workers == 1:
+        return [_run_session_args(session) for session in sessions]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_run_session_args, sessions))
+
+
+def summarize(results: list[SessionResult], wall_seconds: float) -> dict[str, Any]:
+    latencies = sorted(r.seconds for r in results)
+
+    def percentile(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+    return {
+        "sessions": len(results),
+        "failed": sum(1 for r in results if r.error is not None or r.exit_code != 0),
+        "wall_seconds": round(wall_seconds, 3),
+        "sessions_per_second": round(len(results) / wall_seconds, 3) if wall_seconds else 0.0,
+        "latency_mean": round(statistics.fmean(latencies), 3) if latencies else 0.0,
+        "latency_p50": round(percentile(0.5), 3),
+        "latency_p95": round(percentile(0.95), 3),
+        "latency_max": round(latencies[-1], 3) if latencies else 0.0,
+        "donations": sum(len(r.donations) for r in results),
+        "donated_bytes": sum(r.donated_bytes for r in results),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("exports", nargs="+", help="zip files, one session each")
+    parser.add_argument("--out", help="directory to write the donations to, nothing is written without it")
+    parser.add_argument("--workers", type=int, default=1, help="sessions run in parallel, 0 for all cores")
+    parser.add_argument("--repeat", type=int, default=1, help="run every export this many times, for load tests")
+    parser.add_argument("--decline", action="store_true", help="decline on the consent form instead of donating")
+    parser.add_argument("--retries", type=int, default=0, help="times to press Try again for an invalid file")
+    parser.add_argument("--cache-directory", help="directory to cache the extraction results in, shared by sessions")
+    parser.add_argument("--sessions", action="store_true", help="also print the result of every session")
+    args = parser.parse_args()
+
+    answers = Answers(consent=not args.decline, retries=args.retries)
+    out = Path(args.out) if args.out else None
+
+    start_time = time.perf_counter()
+    results = run_batch(args.exports, out, args.workers or None, answers, args.repeat, args.cache_directory)
+    wall_seconds = time.perf_counter() - start_time
+
+    if args.sessions:
+        for result in results:
+            print(json.dumps(asdict(result)))
+    print(json.dumps(summarize(results, wall_seconds), indent=2))
+
+
+if __name__ == "__main__":
+    main()
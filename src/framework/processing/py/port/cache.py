@@ -0,0 +1,137 @@
+"""
+Cache of extraction results, keyed by a fingerprint of the archive
+
+A participant who selects the same export again, in a later session,
+gets the result of the earlier extraction instead of parsing the export again.
+Results are kept in memory (least recently used are evicted) and optionally pickled
+to a cache directory, which should be persistent storage: a plain directory natively,
+an IDBFS mount in the browser. Only the directory outlives a page load
+"""
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, TypeVar
+import hashlib
+import logging
+import os
+import pickle
+
+import port.tracking as tracking
+import port.unzipddp as unzipddp
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Part of every key, increase it when the pickled results change shape
+CACHE_VERSION = 1
+
+
+def fingerprint(zfile: str | unzipddp.DDPArchive) -> str:
+    """
+    Fingerprint of a zip from its size and its central directory: the number of members and the name,
+    CRC, compressed and uncompressed size of every member. Nothing is decompressed
+    """
+    with tracking.span("cache.fingerprint"):
+        digest = hashlib.sha256()
+        with unzipddp.open_archive(zfile) as archive:
+            infolist = archive.infolist()
+            digest.update(f"{archive.size()}\0{len(infolist)}".encode())
+            for info in infolist:
+                digest.update(f"\0{info.filename}\0{info.CRC}\0{info.compress_size}\0{info.file_size}".encode())
+        return digest.hexdigest()
+
+
+def key(*parts: Any) -> str:
+    """
+    Cache key from the fingerprint of an archive and everything else the result depends on
+    """
+    return hashlib.sha256(repr((CACHE_VERSION,) + parts).encode()).hexdigest()
+
+
+class ExtractionCache:
+    """
+    In memory LRU cache of at most max_entries results, backed by an optional directory
+
+    Args:
+        max_entries: number of results kept in memory
+        directory: optional directory the results are pickled to, created when needed
+    """
+
+    def __init__(self, max_entries: int = 2, directory: str | Path | None = None):
+        self.max_entries = max_entries
+        self.directory = Path(directory) if directory is not None else None
+        self.entries: OrderedDict[str, Any] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, cache_key: str) -> Path | None:
+        return self.directory / f"{cache_key}.pickle" if self.directory is not None else None
+
+    def _remember(self, cache_key: str, value: Any) -> None:
+        self.entries[cache_key] = value
+        self.entries.move_to_end(cache_key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get(self, cache_key: str) -> Any | None:
+        """
+        Returns the cached result, or None
+        """
+        if cache_key in self.entries:
+            self.entries.move_to_end(cache_key)
+            self.hits += 1
+            return self.entries[cache_key]
+
+        path = self._path(cache_key)
+        if path is not None and path.exists():
+            try:
+                with tracking.span("cache.load", input_bytes=path.stat().st_size):
+                    with open(path, "rb") as f:
+                        value = pickle.load(f)
+                self._remember(cache_key, value)
+                self.hits += 1
+                return value
+            except Exception as e:
+                logger.error("Could not load cached result: %s", e)
+
+        self.misses += 1
+        return None
+
+    def put(self, cache_key: str, value: Any) -> None:
+        self._remember(cache_key, value)
+
+        path = self._path(cache_key)
+        if path is None:
+            return
+        try:
+            with tracking.span("cache.store"):
+                path.parent.mkdir(parents=True, exist_ok=True)
+                # Written to a temporary file first, so a half written result is never loaded,
+                # one per process as sessions of the batch runner share the directory
+                tmp = path.with_suffix(f".{os.getpid()}.tmp")
+                with open(tmp, "wb") as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, path)
+        except Exception as e:
+            logger.error("Could not store result in cache: %s", e)
+
+    def get_or_compute(self, cache_key: str, compute: Callable[[], T], store: Callable[[T], bool] = bool) -> T:
+        """
+        Returns the cached result, or computes and caches it
+        Results for which store(result) is false (empty ones by default) are not cached
+        """
+        value = self.get(cache_key)
+        if value is not None:
+            logger.info("Using cached extraction result")
+            return value
+
+        value = compute()
+        if store(value):
+            self.put(cache_key, value)
+        return value
+
+    def clear(self) -> None:
+        """
+        Empties the memory cache, the cache directory is left alone
+        """
+        self.entries.clear()
@@ -1,14 +1,19 @@
 """
 DDP extract ChatGPT module
 """
+from collections import deque
+from itertools import islice
 from pathlib import Path
+from typing import TYPE_CHECKING, Any, Iterable, Iterator
 import logging
+import os
+import sys
 import zipfile
 
-import pandas as pd
-
 import port.unzipddp as unzipddp
 import port.helpers as helpers
+import port.tracking as tracking
+from port.api.table import DATETIME, Table
 
 from port.validate import (
     DDPCategory,
@@ -18,6 +23,12 @@ from port.validate import (
     StatusCode,
 )
 
+# pandas is only needed once the conversations are extracted, validate_zip runs without it
+# concurrent.futures loads multiprocessing, which Pyodide does not have, it is imported by _flatten_in_pool
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+    import pandas as pd
+
 logger = logging.getLogger(__name__)
 
 DDP_CATEGORIES = [
@@ -35,7 +46,7 @@ STATUS_CODES = [
 ]
 
 
-def validate_zip(zfile: Path) -> ValidateInput:
+def validate_zip(zfile: Path | unzipddp.DDPArchive) -> ValidateInput:
     """
     Make sure you always set a status code
     """
@@ -43,18 +54,13 @@ def validate_zip(zfile: Path) -> ValidateInput:
     validate = ValidateInput(STATUS_CODES, DDP_CATEGORIES)
 
     try:
-        paths = []
-        with zipfile.ZipFile(zfile, "r") as zf:
-            for f in zf.namelist():
-                p = Path(f)
-                if p.suffix in (".html", ".json"):
-                    logger.debug("Found: %s in zip", p.name)
-                    paths.append(p.name)
-
-        if validate.infer_ddp_category(paths):
-            validate.set_status_code_by_id(0)
-        else:
-            validate.set_status_code_by_id(1)
+        with unzipddp.open_archive(zfile) as archive:
+            # Paths are looked up in the signature index of the categories while the zip is scanned
+            paths = (info.filename for info in archive.infolist() if not info.is_dir())
+            if validate.infer_ddp_category(paths):
+                validate.set_status_code_by_id(0)
+            else:
+                validate.set_status_code_by_id(1)
     except zipfile.BadZipFile:
         validate.set_status_code_by_id(1)
 
@@ -62,42 +68,401 @@ def validate_zip(zfile: Path) -> ValidateInput:
 
 
 
-def conversations_to_df(chatgpt_zip: str)  -> pd.DataFrame:
+COLUMNS = ["conversation title", "role", "message", "model", "time"]
 
-    b = unzipddp.extract_file_from_zip(chatgpt_zip, "conversations.json")
-    conversations = unzipddp.read_json_from_bytes(b)
+# Number of conversations flattened per task in the parallel mode of conversations_to_df
+PARALLEL_BATCH_SIZE = 256
 
-    datapoints = []
-    out = pd.DataFrame()
+# Orders in which the turns of a conversation are visited, see iter_turns
+TRAVERSAL_MAPPING = "mapping"
+TRAVERSAL_ACTIVE = "active"
+TRAVERSAL_ALL = "all"
+TRAVERSALS = (TRAVERSAL_MAPPING, TRAVERSAL_ACTIVE, TRAVERSAL_ALL)
+
+
+def conversations_to_df(
+    chatgpt_zip: str | unzipddp.DDPArchive,
+    streaming: bool = False,
+    backend: str = "pandas",
+    workers: int | None = 1,
+    traversal: str = TRAVERSAL_MAPPING,
+) -> "pd.DataFrame | Table":
+    """
+    Extracts all visible turns of all conversations into a DataFrame
+
+    With streaming=True conversations are decoded one at a time straight from the zip,
+    peak memory then depends on the largest conversation instead of the whole export
+
+    The title, role and model columns are categorical, time is a datetime64 column
+
+    With backend="table" a port.api.table.Table is returned instead and pandas is not imported,
+    time is then a column of datetimes
+
+    With workers > 1 (None for all cores) conversations are flattened in a process pool,
+    in batches of PARALLEL_BATCH_SIZE conversations, for native bulk runs.
+    The result is identical to the sequential path. Under Pyodide, without processes,
+    the sequential path is always used
+
+    traversal selects the turns of a conversation and their order, see iter_turns
+    """
+    if backend not in ("pandas", "table"):
+        raise ValueError(f"Unknown backend: {backend}")
+    if traversal not in TRAVERSALS:
+        raise ValueError(f"Unknown traversal: {traversal}")
+
+    # a stage of its own, not part of the extraction
+    if backend == "pandas":
+        helpers.import_pandas()
+
+    with tracking.span("chatgpt.conversations_to_df") as span:
+        if streaming:
+            conversations = unzipddp.iter_json_array_from_zip(chatgpt_zip, "conversations.json")
+        else:
+            b = unzipddp.extract_file_from_zip(chatgpt_zip, "conversations.json")
+            conversations = unzipddp.read_json_from_bytes(b)
+
+        builder = conversation_builder()
+        out = None
+
+        try:
+            if _parallel(workers):
+                for chunk in _flatten_in_pool(conversations, workers, traversal):
+                    builder.extend(chunk)
+            else:
+                for conversation in conversations:
+                    title = conversation["title"]
+                    for turn in iter_turns(conversation, traversal):
+                        datapoint = turn_to_datapoint(title, turn)
+                        if datapoint is not None:
+                            builder.append(datapoint)
+
+            with tracking.span("chatgpt.build_dataframe") as build_span:
+                out = build(builder, backend)
+                build_span.rows = len(out)
+
+        except Exception as e:
+            logger.error("Data extraction error: %s", e)
+
+        if out is None and backend == "table":
+            out = Table()
+        elif out is None:
+            import pandas as pd
+            out = pd.DataFrame()
+
+        span.rows = len(out)
 
-    try:
-        for conversation in conversations:
-            title = conversation["title"]
-            for _, turn in conversation["mapping"].items():
-
-                denested_d = helpers.dict_denester(turn)
-                is_hidden = helpers.find_item(denested_d, "is_visually_hidden_from_conversation")
-                if is_hidden != "True":
-                    role = helpers.find_item(denested_d, "role")
-                    message = "".join(helpers.find_items(denested_d, "part"))
-                    model = helpers.find_item(denested_d, "-model_slug")
-                    time = helpers.convert_unix_timestamp(helpers.find_item(denested_d, "create_time"))
-
-                    datapoint = {
-                        "conversation title": title,
-                        "role": role,
-                        "message": message,
-                        "model": model,
-                        "time": time,
-                    }
-                    if role != "":
-                        datapoints.append(datapoint)
-
-        out = pd.DataFrame(datapoints)
-
-    except Exception as e:
-        logger.error("Data extraction error: %s", e)
-        
     return out
 
 
+def conversation_builder() -> helpers.ColumnarBuilder:
+    """
+    Builder for the columns of conversations_to_df, rows are the dicts of turn_to_datapoint
+    """
+    return helpers.ColumnarBuilder(
+        COLUMNS,
+        categorical=["conversation title", "role", "model"],
+        converters={"time": helpers.convert_unix_timestamps},
+    )
+
+
+def build(builder: helpers.ColumnarBuilder, backend: str = "pandas") -> "pd.DataFrame | Table":
+    """
+    DataFrame, or Table with backend="table", from a conversation_builder
+    """
+    if backend == "table":
+        return builder.to_table(
+            converters={"time": helpers.unix_timestamps_to_datetimes},
+            dtypes={"time": DATETIME},
+        )
+    return builder.to_dataframe()
+
+
+def iter_conversation_chunks(
+    chatgpt_zip: str | unzipddp.DDPArchive,
+    batch_size: int,
+    traversal: str = TRAVERSAL_MAPPING,
+) -> Iterator[dict[str, list[Any]]]:
+    """
+    Streams the conversations in the zip and yields them flattened, batch_size conversations at a time,
+    as a list of values per column. Add the chunks to a conversation_builder to get a DataFrame:
+    all chunks together give the same result as conversations_to_df
+
+    Unlike conversations_to_df, errors are raised: the caller has to know the chunks are incomplete
+    """
+    if traversal not in TRAVERSALS:
+        raise ValueError(f"Unknown traversal: {traversal}")
+
+    conversations = unzipddp.iter_json_array_from_zip(chatgpt_zip, "conversations.json")
+    while batch := list(islice(conversations, batch_size)):
+        with tracking.span("chatgpt.flatten_chunk") as span:
+            chunk = _flatten_conversations(batch, traversal)
+            span.rows = len(chunk[COLUMNS[0]])
+        yield chunk
+
+
+def _parallel(workers: int | None) -> bool:
+    return sys.platform != "emscripten" and (workers is None or workers > 1)
+
+
+def _flatten_conversations(conversations: list[Any], traversal: str) -> dict[str, list[Any]]:
+    """
+    Flattens a batch of conversations into a list of values per column
+    """
+    chunk: dict[str, list[Any]] = {column: [] for column in COLUMNS}
+    for conversation in conversations:
+        title = conversation["title"]
+        for turn in iter_turns(conversation, traversal):
+            datapoint = turn_to_datapoint(title, turn)
+            if datapoint is not None:
+                for column in COLUMNS:
+                    chunk[column].append(datapoint[column])
+    return chunk
+
+
+def _flatten_in_pool(
+    conversations: Iterable[Any], workers: int | None, traversal: str
+) -> Iterator[dict[str, list[Any]]]:
+    """
+    Yields the flattened batches in the order of the conversations
+    At most two batches per worker are in flight, so a streamed export is not read ahead completely
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    n_workers = workers or os.cpu_count() or 1
+    conversations = iter(conversations)
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        in_flight: "deque[Future]" = deque()
+        while batch := list(islice(conversations, PARALLEL_BATCH_SIZE)):
+            in_flight.append(executor.submit(_flatten_conversations, batch, traversal))
+            if len(in_flight) >= 2 * n_workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def iter_turns(conversation: dict[str, Any], traversal: str = TRAVERSAL_MAPPING) -> Iterator[Any]:
+    """
+    Yields the turns (nodes of the mapping) of a conversation
+
+    traversal:
+        "mapping": every turn in the order of the mapping in the export
+        "active": only the branch shown in ChatGPT, from the root to current_node, in chronological order.
+            Turns of abandoned regenerations and edits are left out.
+            Without a usable current_node this is the same as "all"
+        "all": every turn, depth first from the root, children in the order of their children list.
+            Turns that cannot be reached from a root (broken parent links) follow in mapping order
+    """
+    mapping = conversation["mapping"]
+
+    if traversal == TRAVERSAL_MAPPING:
+        yield from mapping.values()
+    elif traversal == TRAVERSAL_ACTIVE:
+        branch = _active_branch(mapping, conversation.get("current_node"))
+        if branch:
+            yield from branch
+        else:
+            yield from _depth_first(mapping)
+    elif traversal == TRAVERSAL_ALL:
+        yield from _depth_first(mapping)
+    else:
+        raise ValueError(f"Unknown traversal: {traversal}")
+
+
+def _active_branch(mapping: dict[str, Any], current_node: str | None) -> list[Any]:
+    """
+    Turns from the root to current_node, found by following the parent links up from current_node
+    """
+    branch = []
+    seen = set()
+    node_id = current_node
+    while node_id is not None and node_id in mapping and node_id not in seen:
+        seen.add(node_id)
+        node = mapping[node_id]
+        branch.append(node)
+        node_id = node.get("parent")
+
+    branch.reverse()
+    return branch
+
+
+def _depth_first(mapping: dict[str, Any]) -> Iterator[Any]:
+    """
+    Iterative depth first traversal from the roots: nodes without a parent in the mapping
+    """
+    seen: set[str] = set()
+    roots = [node_id for node_id, node in mapping.items() if node.get("parent") not in mapping]
+
+    for root in roots:
+        stack = [root]
+        while stack:
+            node_id = stack.pop()
+            if node_id in seen or node_id not in mapping:
+                continue
+            seen.add(node_id)
+            node = mapping[node_id]
+            yield node
+            stack.extend(reversed(node.get("children") or []))
+
+    for node_id, node in mapping.items():
+        if node_id not in seen:
+            yield node
+
+
+def turn_to_datapoint(title: str, turn: Any) -> dict[str, Any] | None:
+    """
+    Converts a node of a conversation mapping to a row of the conversations table
+    Returns None if the turn should not be shown
+    The time is returned unconverted, see helpers.convert_unix_timestamps
+
+    Nodes with the known ChatGPT shape are read directly,
+    all other nodes go through the generic dict_denester lookups
+    """
+    try:
+        return _turn_to_datapoint_direct(title, turn)
+    except _UnexpectedShape:
+        return _turn_to_datapoint_denested(title, turn)
+
+
+def _turn_to_datapoint_denested(title: str, turn: Any) -> dict[str, Any] | None:
+    denested_d = helpers.dict_denester(turn)
+    is_hidden = helpers.find_item(denested_d, "is_visually_hidden_from_conversation")
+    if is_hidden == "True":
+        return None
+
+    role = helpers.find_item(denested_d, "role")
+    message = "".join(helpers.find_items(denested_d, "part"))
+    model = helpers.find_item(denested_d, "-model_slug")
+    time = helpers.find_item(denested_d, "create_time")
+
+    datapoint = {
+        "conversation title": title,
+        "role": role,
+        "message": message,
+        "model": model,
+        "time": time,
+    }
+    if role == "":
+        return None
+
+    return datapoint
+
+
+class _UnexpectedShape(Exception):
+    """
+    The node does not have the shape _turn_to_datapoint_direct can read
+    """
+
+
+# Substrings looked up by _turn_to_datapoint_denested, "-model_slug" is checked separately
+_LOOKUPS = ("is_visually_hidden_from_conversation", "role", "part", "create_time")
+_LOOKUPS_IN_PARTS = ("is_visually_hidden_from_conversation", "role", "create_time")
+
+
+def _check_subtree(key: str, value: Any, lookups: tuple[str, ...]) -> None:
+    """
+    Raises _UnexpectedShape if any key below (and including) key
+    could be matched by one of the lookups after denesting,
+    that would change the result of the lookups in _turn_to_datapoint_denested
+    """
+    stack = [(key, value)]
+    while stack:
+        k, v = stack.pop()
+        if "-" in k or k.startswith("model_slug") or any(lookup in k for lookup in lookups):
+            raise _UnexpectedShape(k)
+
+        if isinstance(v, dict):
+            stack.extend((str(kk), vv) for kk, vv in v.items())
+        elif isinstance(v, list):
+            stack.extend(("", vv) for vv in v)
+
+
+def _scalar(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        raise _UnexpectedShape("Expected a scalar")
+    return value
+
+
+def _dict(value: Any) -> dict[Any, Any]:
+    if not isinstance(value, dict):
+        raise _UnexpectedShape("Expected a dict")
+    return value
+
+
+def _turn_to_datapoint_direct(title: str, turn: Any) -> dict[str, Any] | None:
+    """
+    Reads message.author.role, message.content.parts, message.metadata.model_slug,
+    message.create_time and message.metadata.is_visually_hidden_from_conversation directly
+
+    Gives the same result as _turn_to_datapoint_denested,
+    raises _UnexpectedShape if that cannot be guaranteed for this turn
+    """
+    message = None
+    for key, value in _dict(turn).items():
+        if key == "message":
+            message = value
+        else:
+            _check_subtree(key, value, _LOOKUPS)
+
+    if message is None or not isinstance(message, (dict, list)):
+        return None
+
+    author: dict[Any, Any] = {}
+    content: dict[Any, Any] = {}
+    metadata: dict[Any, Any] = {}
+    create_time = None
+    for key, value in _dict(message).items():
+        if key == "author":
+            author = _dict(value)
+        elif key == "content":
+            content = _dict(value)
+        elif key == "metadata":
+            metadata = _dict(value)
+        elif key == "create_time":
+            create_time = _scalar(value)
+        else:
+            _check_subtree(key, value, _LOOKUPS)
+
+    role = ""
+    for key, value in author.items():
+        if key == "role":
+            if not isinstance(value, str):
+                raise _UnexpectedShape("Expected role to be a string")
+            role = value
+        else:
+            _check_subtree(key, value, _LOOKUPS)
+
+    parts = []
+    for key, value in content.items():
+        if key == "parts":
+            if not isinstance(value, list):
+                raise _UnexpectedShape("Expected parts to be a list")
+            for part in value:
+                if isinstance(part, (dict, list)):
+                    _check_subtree("", part, _LOOKUPS_IN_PARTS)
+                    parts.extend(str(v) for v in helpers.dict_denester(part).values())
+                else:
+                    parts.append(str(part))
+        else:
+            _check_subtree(key, value, _LOOKUPS)
+
+    is_hidden = ""
+    model = ""
+    for key, value in metadata.items():
+        if key == "is_visually_hidden_from_conversation":
+            is_hidden = str(_scalar(value))
+        elif key == "model_slug":
+            model = str(_scalar(value))
+        else:
+            _check_subtree(key, value, _LOOKUPS)
+
+    if is_hidden == "True" or role == "":
+        return None
+
+    return {
+        "conversation title": title,
+        "role": role,
+        "message": "".join(parts),
+        "model": model,
+        "time": create_time,
+    }
@@ -1,40 +1,288 @@
-import pandas as pd
+import array
+import bisect
 import math
 import re
+import sys
+import time
 import logging 
+from collections.abc import Sequence
 from datetime import datetime
-from typing import Any
+from typing import TYPE_CHECKING, Any, Callable, Iterable, overload
+
+import port.tracking as tracking
+
+# pandas and numpy are imported on first use, so the helpers that do not need them
+# (dict_denester, find_item, ...) can be used before the extraction
+if TYPE_CHECKING:
+    import pandas as pd
+    from port.api.table import Table
 
 logger = logging.getLogger(__name__)
 
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 
-def split_dataframe(df: pd.DataFrame, row_count: int) -> list[pd.DataFrame]:
+
+class DataFrameChunks(Sequence):
     """
-    Port has trouble putting large tables in memory. 
-    Has to be expected. Solution split tables into smaller tables.
-    I have tried non-bespoke table soluions they did not perform any better
+    Chunks of row_count rows of a table, made when they are accessed
 
-    I hope you have an idea to make tables faster! Would be nice
+    A chunk is a positional slice (df.iloc[start:stop], or Table.slice), nothing is copied up front
+    and the index is not reset: rows keep their labels from the complete table.
+    Reset the index of a single chunk if it has to be numbered from 0.
+    Slicing gives a list of chunks
     """
-    # Calculate the number of splits needed.
-    num_splits = int(len(df) / row_count) + (len(df) % row_count > 0)
 
-    # Split the DataFrame into chunks of size row_count.
-    df_splits = [df[i*row_count:(i+1)*row_count].reset_index(drop=True) for i in range(num_splits)]
+    def __init__(self, df: "pd.DataFrame | Table", row_count: int):
+        if row_count < 1:
+            raise ValueError("row_count should be at least 1")
+        self.df = df
+        self.row_count = row_count
+        self.n_rows = len(df)
+
+    def __len__(self) -> int:
+        return math.ceil(self.n_rows / self.row_count)
+
+    def row_range(self, i: int) -> range:
+        """
+        Positions of the rows in chunk i
+        """
+        n_chunks = len(self)
+        if i < 0:
+            i += n_chunks
+        if not 0 <= i < n_chunks:
+            raise IndexError(f"chunk {i} out of range, there are {n_chunks} chunks")
+        start = i * self.row_count
+        return range(start, min(start + self.row_count, self.n_rows))
+
+    @overload
+    def __getitem__(self, i: int) -> "pd.DataFrame | Table": ...
+
+    @overload
+    def __getitem__(self, i: slice) -> "list[pd.DataFrame | Table]": ...
+
+    def __getitem__(self, i: int | slice) -> "pd.DataFrame | Table | list[pd.DataFrame | Table]":
+        if isinstance(i, slice):
+            # a list of chunks, like slicing the list split_dataframe used to return
+            return [self[j] for j in range(len(self))[i]]
+
+        rows = self.row_range(i)
+        if hasattr(self.df, "iloc"):
+            return self.df.iloc[rows.start:rows.stop]
+        return self.df.slice(rows.start, rows.stop)
+
+
+def split_dataframe(df: "pd.DataFrame | Table", row_count: int) -> DataFrameChunks:
+    """
+    Port has trouble putting large tables in memory. 
+    Has to be expected. Solution split tables into smaller tables.
 
-    return df_splits
+    The chunks are not copied: the result is a sequence that slices a chunk when it is accessed,
+    see DataFrameChunks
+    """
+    return DataFrameChunks(df, row_count)
 
 
 def convert_unix_timestamp(timestamp: str) -> str:
     out = timestamp
     try:
-        out = datetime.fromtimestamp(float(timestamp)).strftime("%Y-%m-%d %H:%M:%S")
+        out = datetime.fromtimestamp(float(timestamp)).strftime(DATETIME_FORMAT)
     except Exception as e:
-        print(e)
+        logger.debug("Could not convert timestamp: %s", e)
 
     return  out
 
 
+def import_pandas() -> None:
+    """
+    Imports pandas, numpy and dateutil in a tracking span of their own ("import.pandas")
+    Call it before a timed stage that builds a DataFrame, so the first stage is not charged for the import,
+    which takes seconds under Pyodide
+    """
+    if "pandas" in sys.modules and "dateutil.tz" in sys.modules:
+        return
+    with tracking.span("import.pandas"):
+        import dateutil.tz  # noqa: F401
+        import numpy  # noqa: F401
+        import pandas  # noqa: F401
+
+
+def convert_unix_timestamps(timestamps: Iterable[Any], tz: Any = None) -> "pd.Series":
+    """
+    Converts a whole column of unix timestamps (in seconds) to a datetime64 column in one pass
+
+    Like convert_unix_timestamp the result is in local time, unless tz is given, and timezone naive.
+    Values that cannot be converted become NaT, they are counted and logged once
+    """
+    import pandas as pd
+    import dateutil.tz
+
+    seconds = pd.to_numeric(pd.Series(timestamps, dtype="object"), errors="coerce")
+
+    # datetime.fromtimestamp rounds to microseconds
+    out = pd.to_datetime((seconds * 1e6).round(), unit="us", errors="coerce")
+
+    if tz is None and (time.timezone != 0 or time.daylight):
+        tz = dateutil.tz.tzlocal()
+    if tz is not None:
+        out = out.dt.tz_localize("UTC").dt.tz_convert(tz).dt.tz_localize(None)
+
+    n_failed = int(out.isna().sum())
+    if n_failed > 0:
+        logger.info("Could not convert %s out of %s timestamps", n_failed, len(out))
+
+    return out
+
+
+def unix_timestamps_to_datetimes(timestamps: Iterable[Any]) -> list[datetime | None]:
+    """
+    Like convert_unix_timestamps without pandas: naive datetimes in local time
+    Values that cannot be converted become None, they are counted and logged once
+    """
+    out = []
+    n_failed = 0
+    for timestamp in timestamps:
+        try:
+            out.append(datetime.fromtimestamp(float(timestamp)))
+        except (TypeError, ValueError, OverflowError, OSError):
+            out.append(None)
+            n_failed += 1
+
+    if n_failed > 0:
+        logger.info("Could not convert %s out of %s timestamps", n_failed, len(out))
+
+    return out
+
+
+def format_datetimes(datetimes: "pd.Series") -> "pd.Series":
+    """
+    Formats a datetime64 column as strings in one pass, missing values become empty strings
+    """
+    return datetimes.dt.strftime(DATETIME_FORMAT).fillna("")
+
+
+
+class ColumnarBuilder:
+    """
+    Builds a DataFrame column by column, as an alternative to pd.DataFrame(list_of_dicts)
+
+    Rows are appended into per-column buffers.
+    Categorical columns are dictionary encoded while appending: every distinct value is stored once
+    and the column only holds integer codes, the result is a column with category dtype.
+    Converters are applied to the complete buffer of a column when the DataFrame is created
+    """
+
+    def __init__(
+        self,
+        columns: list[str],
+        categorical: list[str] | None = None,
+        converters: dict[str, Callable[[list[Any]], Any]] | None = None,
+    ):
+        self.columns = columns
+        self.converters = converters or {}
+        self._values: dict[str, list[Any]] = {}
+        self._codes: dict[str, array.array] = {}
+        self._categories: dict[str, dict[Any, int]] = {}
+        self._n_rows = 0
+
+        for column in columns:
+            if categorical and column in categorical:
+                self._codes[column] = array.array("i")
+                self._categories[column] = {}
+            else:
+                self._values[column] = []
+
+    def __len__(self) -> int:
+        return self._n_rows
+
+    def append(self, row: dict[str, Any]) -> None:
+        for column, codes in self._codes.items():
+            value = row[column]
+            if value is None:
+                codes.append(-1)
+                continue
+            categories = self._categories[column]
+            code = categories.get(value)
+            if code is None:
+                code = categories[value] = len(categories)
+            codes.append(code)
+
+        for column, values in self._values.items():
+            values.append(row[column])
+
+        self._n_rows += 1
+
+    def extend(self, chunk: dict[str, list[Any]]) -> None:
+        """
+        Appends a columnar chunk: a list of values per column, all of the same length
+        """
+        n_rows = len(chunk[self.columns[0]]) if self.columns else 0
+
+        for column, codes in self._codes.items():
+            categories = self._categories[column]
+            for value in chunk[column]:
+                if value is None:
+                    codes.append(-1)
+                    continue
+                code = categories.get(value)
+                if code is None:
+                    code = categories[value] = len(categories)
+                codes.append(code)
+
+        for column, values in self._values.items():
+            values.extend(chunk[column])
+
+        self._n_rows += n_rows
+
+    def to_dataframe(self) -> "pd.DataFrame":
+        import numpy as np
+        import pandas as pd
+
+        if self._n_rows == 0:
+            return pd.DataFrame()
+
+        data = {}
+        for column in self.columns:
+            if column in self._codes:
+                codes = np.frombuffer(self._codes[column], dtype=np.int32)
+                data[column] = pd.Categorical.from_codes(codes, categories=list(self._categories[column]))
+            else:
+                values = self._values[column]
+                converter = self.converters.get(column)
+                data[column] = converter(values) if converter else values
+
+        return pd.DataFrame(data, columns=self.columns)
+
+    def to_table(
+        self,
+        converters: dict[str, Callable[[list[Any]], Any]] | None = None,
+        dtypes: dict[str, str] | None = None,
+    ) -> "Table":
+        """
+        Builds a port.api.table.Table instead of a DataFrame, without pandas
+
+        converters replace the converters given to the builder, they should return lists
+        Categorical columns get the category dtype, other dtypes can be given with dtypes
+        """
+        from port.api.table import CATEGORY, Table
+
+        if self._n_rows == 0:
+            return Table()
+
+        converters = self.converters if converters is None else converters
+        data = {}
+        column_dtypes = dict(dtypes or {})
+        for column in self.columns:
+            if column in self._codes:
+                categories = list(self._categories[column])
+                data[column] = [categories[code] if code >= 0 else None for code in self._codes[column]]
+                column_dtypes.setdefault(column, CATEGORY)
+            else:
+                values = self._values[column]
+                converter = converters.get(column)
+                data[column] = converter(values) if converter else values
+
+        return Table(data, column_dtypes)
+
 
 def dict_denester(
     inp: dict[Any, Any] | list[Any],
@@ -68,9 +316,145 @@ def dict_denester(
 
 
 
-def find_item(d: dict[Any, Any],  key_to_match: str) -> str:
+class DenestedIndex:
     """
-    d is a denested dict
+    Index over a denested dict (the output of dict_denester)
+    Build once, then use as a drop-in replacement for the dict in find_item and find_items
+
+    Keys are split on "-" into tokens, and every token points to the keys it occurs in.
+    Tokens that contain, start or end with a piece of key_to_match are found by binary search
+    in a sorted list of the suffixes of all distinct tokens, built on the first lookup.
+    A lookup then takes O(log S + matches) for S suffixes instead of a scan over every key,
+    results are cached per key_to_match.
+    key_to_match that is a real regex (not just a literal) still scans every key
+    """
+
+    def __init__(self, d: dict[Any, Any]):
+        self.keys = [str(k) for k in d.keys()]
+        self.values = list(d.values())
+        self.depths = [k.count("-") for k in self.keys]
+
+        self._postings: dict[str, list[int]] = {}
+        for i, k in enumerate(self.keys):
+            for token in set(k.split("-")):
+                self._postings.setdefault(token, []).append(i)
+
+        # re.match("^.*key.*$") does not match across newlines, these keys are checked with the regex
+        self._multiline = {i for i, k in enumerate(self.keys) if "\n" in k}
+        self._matches: dict[str, list[int]] = {}
+
+        # suffix array of the distinct tokens, see _build_suffixes
+        self._tokens: list[str] = []
+        self._suffixes: list[str] = []
+        self._suffix_tokens: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def matches(self, key_to_match: str) -> list[int]:
+        """
+        Positions of all keys that contain key_to_match, in the order of the denested dict
+        """
+        if key_to_match not in self._matches:
+            try:
+                self._matches[key_to_match] = self._lookup(key_to_match)
+            except Exception as e:
+                logger.error("bork bork: %s", e)
+                self._matches[key_to_match] = []
+        return self._matches[key_to_match]
+
+    def _lookup(self, key_to_match: str) -> list[int]:
+        pattern = re.compile(r"{}".format(f"^.*{key_to_match}.*$"))
+
+        if re.escape(key_to_match) != key_to_match.replace("-", "\\-"):
+            # key_to_match is a real regex, scan all keys
+            return [i for i, k in enumerate(self.keys) if pattern.match(k)]
+
+        pieces = key_to_match.split("-")
+        if len(pieces) == 1 and key_to_match:
+            candidates = self._positions(self._tokens_with(key_to_match, whole_suffix=False))
+        elif len(pieces) > 2:
+            # tokens in the middle have to match exactly
+            middle = [self._postings.get(p, []) for p in pieces[1:-1]]
+            candidates = min(middle, key=len)
+        elif pieces[0]:
+            candidates = self._positions(self._tokens_with(pieces[0], whole_suffix=True))
+        elif pieces[-1]:
+            candidates = self._positions(self._tokens_starting_with(pieces[-1]))
+        else:
+            candidates = range(len(self.keys))  # type: ignore
+
+        out = []
+        for i in candidates:
+            k = self.keys[i]
+            if i in self._multiline:
+                if pattern.match(k):
+                    out.append(i)
+            elif key_to_match in k:
+                out.append(i)
+
+        return out
+
+    def _build_suffixes(self) -> None:
+        if self._tokens or not self._postings:
+            return
+        self._tokens = sorted(self._postings)
+        suffixes = sorted(
+            (token[start:], t) for t, token in enumerate(self._tokens) for start in range(len(token))
+        )
+        self._suffixes = [suffix for suffix, _ in suffixes]
+        self._suffix_tokens = [t for _, t in suffixes]
+
+    def _tokens_with(self, piece: str, whole_suffix: bool) -> set[str]:
+        """
+        Tokens that contain piece, or that end with piece when whole_suffix is set
+        """
+        self._build_suffixes()
+        tokens = set()
+        i = bisect.bisect_left(self._suffixes, piece)
+        while i < len(self._suffixes) and self._suffixes[i].startswith(piece):
+            if whole_suffix and self._suffixes[i] != piece:
+                # suffixes equal to piece sort before the longer ones
+                break
+            tokens.add(self._tokens[self._suffix_tokens[i]])
+            i += 1
+        return tokens
+
+    def _tokens_starting_with(self, piece: str) -> set[str]:
+        self._build_suffixes()
+        tokens = set()
+        i = bisect.bisect_left(self._tokens, piece)
+        while i < len(self._tokens) and self._tokens[i].startswith(piece):
+            tokens.add(self._tokens[i])
+            i += 1
+        return tokens
+
+    def _positions(self, tokens: set[str]) -> list[int]:
+        positions: set[int] = set()
+        for token in tokens:
+            positions.update(self._postings[token])
+        return sorted(positions)
+
+    def find_item(self, key_to_match: str) -> str:
+        """
+        See find_item
+        """
+        positions = self.matches(key_to_match)
+        if not positions:
+            return ""
+        least_nested = min(positions, key=lambda i: self.depths[i])
+        return str(self.values[least_nested])
+
+    def find_items(self, key_to_match: str) -> list:
+        """
+        See find_items
+        """
+        return [str(self.values[i]) for i in self.matches(key_to_match)]
+
+
+def find_item(d: dict[Any, Any] | DenestedIndex,  key_to_match: str) -> str:
+    """
+    d is a denested dict or a DenestedIndex
     match all keys in d that contain key_to_match
 
     return the value beloning to that key that is the least nested
@@ -87,13 +471,16 @@ def find_item(d: dict[Any, Any],  key_to_match: str) -> str:
 
     This function is needed because your_posts_1.json contains a wide variety of nestedness per post
     """
+    if isinstance(d, DenestedIndex):
+        return d.find_item(key_to_match)
+
     out = ""
-    pattern = r"{}".format(f"^.*{key_to_match}.*$")
     depth = math.inf
 
     try:
+        pattern = re.compile(r"{}".format(f"^.*{key_to_match}.*$"))
         for k, v in d.items():
-            if re.match(pattern, k):
+            if pattern.match(k):
                 depth_current_match = k.count("-")
                 if depth_current_match < depth:
                     depth = depth_current_match
@@ -105,18 +492,20 @@ def find_item(d: dict[Any, Any],  key_to_match: str) -> str:
 
 
 
-def find_items(d: dict[Any, Any],  key_to_match: str) -> list:
+def find_items(d: dict[Any, Any] | DenestedIndex,  key_to_match: str) -> list:
     """
-    d is a denested dict
+    d is a denested dict or a DenestedIndex
     find all items in a denested dict return list
     """
+    if isinstance(d, DenestedIndex):
+        return d.find_items(key_to_match)
+
     out = []
-    pattern = r"{}".format(f"^.*{key_to_match}.*$")
-    depth = math.inf
 
     try:
+        pattern = re.compile(r"{}".format(f"^.*{key_to_match}.*$"))
         for k, v in d.items():
-            if re.match(pattern, k):
+            if pattern.match(k):
                 out.append(str(v))
     except Exception as e:
         logger.error("bork bork: %s", e)
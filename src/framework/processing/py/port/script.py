@@ -1,23 +1,57 @@
 import logging
 import json
-import io
 
-from port.api.commands import (CommandSystemDonate, CommandSystemExit, CommandUIRender)
+from port.api.commands import (
+    CommandSystemDonate, CommandSystemExit, CommandUIRender, CommandUITableAppend, CommandUITablePage, split_donation
+)
 import port.api.props as props
+from port.api.table import Table
+import port.cache as cache
 import port.chatgpt as chatgpt
+import port.helpers as helpers
+import port.unzipddp as unzipddp
+import port.term_frequencies as term_frequencies
+import port.tracking as tracking
 
 
-LOG_STREAM = io.StringIO()
-
-logging.basicConfig(
-    stream=LOG_STREAM,
-    level=logging.INFO,
-    format="%(asctime)s --- %(name)s --- %(levelname)s --- %(message)s",
-    datefmt="%Y-%m-%dT%H:%M:%S%z",
-)
+LOG_HANDLER = tracking.RingBufferHandler(capacity=1000)
 
 LOGGER = logging.getLogger("script")
 
+# Number of rows per page of the consent form tables
+# None sends complete tables, set it only if the host sends page requests (see render_table_page)
+TABLE_PAGE_SIZE = None
+
+# Wire format of the consent form tables, None is the DataFrame.to_json format
+# Set to port.api.encoding.COLUMNAR only if the host can decode it
+TABLE_DATA_FORMAT = None
+
+# Table type of the extracted data: "pandas" for a DataFrame, "table" for port.api.table.Table
+# With "table" pandas is never imported, numpy and pandas can then be left out of loadPackages in py_worker.js
+TABLE_BACKEND = "pandas"
+
+# Donations are send in gzip compressed chunks of at most this number of bytes, None sends them whole
+# The receiving end has to reassemble the chunks, see port.api.commands.join_donation
+DONATION_CHUNK_SIZE = None
+
+# Turns of a conversation shown in the consent form, see chatgpt.iter_turns
+# "active" shows the conversation as the participant sees it in ChatGPT, without abandoned regenerations
+TRAVERSAL = chatgpt.TRAVERSAL_ACTIVE
+
+# Directory the extraction results are cached in, so selecting the same export again skips the extraction
+# None disables the cache: every page load starts a new worker, a result kept in memory only is never used again
+# In the browser the directory has to be persistent storage, like an IDBFS mount
+CACHE_DIRECTORY = None
+
+EXTRACTION_CACHE = cache.ExtractionCache(max_entries=2, directory=CACHE_DIRECTORY) if CACHE_DIRECTORY else None
+
+# Number of conversations extracted before the consent form is shown, None shows it after the extraction
+# The rest of the conversations are appended to the table in batches of this size while the participant reviews,
+# set it only if the host handles pending tables (see render_progressive_consent_form)
+PROGRESSIVE_BATCH_SIZE = None
+
+CHATGPT_TABLE_ID = "chatgpt_conversations"
+
 # Headers
 SUBMIT_FILE_HEADER = props.Translatable({
     "en": "Select your ChatGPT file", 
@@ -35,13 +69,29 @@ RETRY_HEADER = props.Translatable({
 })
 
 
+def configure_logging():
+    """
+    Sends the log records to LOG_HANDLER, done when the flow starts instead of on import
+    basicConfig does nothing when logging is already configured
+    """
+    logging.basicConfig(
+        handlers=[LOG_HANDLER],
+        level=logging.INFO,
+        format="%(asctime)s --- %(name)s --- %(levelname)s --- %(message)s",
+        datefmt="%Y-%m-%dT%H:%M:%S%z",
+    )
+
+
 def process(session_id):
+    configure_logging()
     LOGGER.info("Starting the donation flow")
     yield donate_logs(f"{session_id}-tracking")
 
 
     platform_name = "ChatGPT"
     table_list = None
+    archive = None
+    progressive = False
 
     while True:
         LOGGER.info("Prompt for file for %s", platform_name)
@@ -51,7 +101,11 @@ def process(session_id):
         file_result = yield render_page(SUBMIT_FILE_HEADER, file_prompt)
 
         if file_result.__type__ == "PayloadString":
-            validation = chatgpt.validate_zip(file_result.value)
+            # The zip is opened once and kept open for the rest of the flow
+            if archive is not None:
+                archive.close()
+            archive = unzipddp.DDPArchive(file_result.value)
+            validation = chatgpt.validate_zip(archive)
             print("VALIDATION")
             print(validation)
 
@@ -61,12 +115,20 @@ def process(session_id):
                 LOGGER.info("Payload for %s", platform_name)
                 yield donate_logs(f"{session_id}-tracking")
 
-                extraction_result = extract_chatgpt(file_result.value)
-                table_list = extraction_result
+                cache_key = chatgpt_cache_key(archive) if EXTRACTION_CACHE is not None else None
+                if PROGRESSIVE_BATCH_SIZE:
+                    # A cached result is complete already, there is nothing to show progressively
+                    table_list = EXTRACTION_CACHE.get(cache_key) if EXTRACTION_CACHE is not None else None
+                    progressive = table_list is None
+                else:
+                    extraction_result = extract_chatgpt_cached(archive, cache_key)
+                    table_list = extraction_result
                 break
 
             # Enter retry flow, reason: if DDP was not a ChatGPT DDP
             if validation.status_code.id != 0:
+                archive.close()
+                archive = None
                 LOGGER.info("Not a valid %s zip; No payload; prompt retry_confirmation", platform_name)
                 yield donate_logs(f"{session_id}-tracking")
                 retry_result = yield render_page(RETRY_HEADER, retry_confirmation(platform_name))
@@ -86,19 +148,33 @@ def process(session_id):
             break
 
 
-    if table_list is not None:
+    consent_result = None
+    if progressive:
+        LOGGER.info("Prompt progressive consent; %s", platform_name)
+        yield donate_logs(f"{session_id}-tracking")
+        consent_result, table_list = yield from render_progressive_consent_form(archive, cache_key)
+
+    elif table_list is not None:
         LOGGER.info("Prompt consent; %s", platform_name)
         yield donate_logs(f"{session_id}-tracking")
         prompt = create_consent_form(table_list)
         consent_result = yield render_page(REVIEW_DATA_HEADER, prompt)
 
+    if consent_result is not None:
+        # The host asks for other pages of paged tables until the participant is done
+        while consent_result.__type__ == "PayloadTablePageRequest":
+            consent_result = yield render_table_page(table_list, consent_result.value)
+
         # Data was donated
         if consent_result.__type__ == "PayloadJSON":
             LOGGER.info("Data donated; %s", platform_name)
-            yield donate(f"{session_id}-{platform_name}", consent_result.value)
+            for command in donate_chunked(f"{session_id}-{platform_name}", consent_result.value):
+                yield command
             yield donate_logs(f"{session_id}-tracking")
             yield donate_status(f"{session_id}-DONATED", "DONATED")
 
+    if archive is not None:
+        archive.close()
 
     yield exit(0, "Success")
     yield render_end_page()
@@ -114,13 +190,13 @@ def create_consent_form(table_list: list[props.PropsUIPromptConsentFormTable]) -
 
 
 def donate_logs(key):
-    log_string = LOG_STREAM.getvalue()  # read the log stream
-    if log_string:
-        log_data = log_string.split("\n")
-    else:
-        log_data = ["no logs"]
-
-    return donate(key, json.dumps(log_data))
+    """
+    Donates the log records added since the previous call and the timings of the session so far
+    Every call gets its own key: <key>-<number of the call>, so earlier records are not overwritten
+    """
+    records, dropped = LOG_HANDLER.collect()
+    log_data = {"records": records, "dropped": dropped, "timings": tracking.TIMINGS.summary()}
+    return donate(f"{key}-{LOG_HANDLER.n_collections - 1}", json.dumps(log_data))
 
 
 
@@ -133,36 +209,187 @@ def donate_status(filename: str, message: str):
 # Extraction function
 
 # The A conditional group gets the visualizations 
-def extract_chatgpt(chatgpt_zip: str) -> list[props.PropsUIPromptConsentFormTable]:
+def extract_chatgpt(chatgpt_zip: str | unzipddp.DDPArchive) -> list[props.PropsUIPromptConsentFormTable]:
 
     tables_to_render = []
     
-    df = chatgpt.conversations_to_df(chatgpt_zip)
+    df = chatgpt.conversations_to_df(chatgpt_zip, streaming=True, backend=TABLE_BACKEND, traversal=TRAVERSAL)
     if not df.empty:
-        table_title = props.Translatable({"en": "Your conversations with ChatGPT", "nl": "Uw gesprekken met ChatGPT"})
-        table_description = props.Translatable({
-            "en": "Table description", 
-            "nl": "Table description"
-        })
-        wordcloud = {
-            "title": {"en": "", "nl": ""},
-            "type": "wordcloud",
-            "textColumn": "message",
-            "tokenize": True,
-        }
-        table = props.PropsUIPromptConsentFormTable("chatgpt_conversations", table_title, df, table_description, [wordcloud])
-        tables_to_render.append(table)
+        # Precomputed, so the participant's browser does not have to tokenize every message
+        terms = term_frequencies.TermFrequencies()
+        terms.add(df["message"])
+        tables_to_render.append(chatgpt_table(df, terms))
 
     return tables_to_render
 
 
 
+def chatgpt_table(
+    df, terms: term_frequencies.TermFrequencies, pending: bool = False
+) -> props.PropsUIPromptConsentFormTable:
+    """
+    Consent form table of the conversations in df, terms are the term frequencies of its messages
+    A pending table is not paged, its rows are appended instead
+    """
+    table_title = props.Translatable({"en": "Your conversations with ChatGPT", "nl": "Uw gesprekken met ChatGPT"})
+    table_description = props.Translatable({
+        "en": "Table description", 
+        "nl": "Table description"
+    })
+    return props.PropsUIPromptConsentFormTable(
+        CHATGPT_TABLE_ID, table_title, df, table_description, [wordcloud(terms, len(df))],
+        page_size=None if pending else TABLE_PAGE_SIZE, data_format=TABLE_DATA_FORMAT, pending=pending
+    )
+
+
+
+def wordcloud(terms: term_frequencies.TermFrequencies, n_rows: int) -> dict:
+    return {
+        "title": {"en": "", "nl": ""},
+        "type": "wordcloud",
+        "textColumn": "message",
+        "tokenize": True,
+        "topTerms": terms.top_terms(),
+        "nRows": n_rows,
+    }
+
+
+
+def render_progressive_consent_form(chatgpt_zip: str | unzipddp.DDPArchive, cache_key: str | None = None):
+    """
+    Shows the consent form once the first PROGRESSIVE_BATCH_SIZE conversations are extracted
+    and appends the rest in batches, so the participant can start reviewing during the extraction
+    Used with yield from, returns the consent result and the tables with all extracted rows
+
+    Contract with the host:
+    * a consent form with a pending table is rendered and answered right away with PayloadVoid
+    * every CommandUITableAppend adds its rows to the table and is answered with PayloadVoid,
+      or with the consent result when the participant already submitted or declined, the extraction then stops
+    * the last append has pending false, the host answers it with the consent result once the participant is done
+
+    The visualizations of the first batch are replaced by those of all rows with the last append
+    A complete extraction is cached like extract_chatgpt_cached does, under cache_key if it is given
+    """
+    if TABLE_BACKEND == "pandas":
+        helpers.import_pandas()
+
+    builder = chatgpt.conversation_builder()
+    terms = term_frequencies.TermFrequencies()
+    chunks = chatgpt.iter_conversation_chunks(chatgpt_zip, PROGRESSIVE_BATCH_SIZE, TRAVERSAL)
+    failed = False
+
+    def next_chunk():
+        nonlocal failed
+        try:
+            return next(chunks, None)
+        except Exception as e:
+            LOGGER.error("Data extraction error: %s", e)
+            failed = True
+            return None
+
+    def add_chunk(chunk):
+        builder.extend(chunk)
+        batch_builder = chatgpt.conversation_builder()
+        batch_builder.extend(chunk)
+        batch = chatgpt.build(batch_builder, TABLE_BACKEND)
+        terms.add(batch["message"])
+        return batch
+
+    # The first batches can be without visible turns, the form is shown with the first rows
+    chunk = next_chunk()
+    while chunk is not None and not chunk[chatgpt.COLUMNS[0]]:
+        chunk = next_chunk()
+    following = next_chunk() if chunk is not None else None
+
+    tables = []
+    if chunk is not None:
+        batch = add_chunk(chunk)
+        tables.append(chatgpt_table(batch, terms, pending=following is not None))
+        offset = len(batch)
+    result = yield render_page(REVIEW_DATA_HEADER, create_consent_form(tables))
+
+    chunk = following
+    while chunk is not None and result.__type__ == "PayloadVoid":
+        following = next_chunk()
+        batch = add_chunk(chunk)
+        pending = following is not None
+        if pending and len(batch) == 0:
+            chunk = following
+            continue
+
+        visualizations = None if pending else [wordcloud(terms, len(builder))]
+        table_append = props.PropsUITableAppend(
+            CHATGPT_TABLE_ID, offset, batch, pending, data_format=TABLE_DATA_FORMAT, visualizations=visualizations
+        )
+        result = yield CommandUITableAppend(table_append)
+        offset += len(batch)
+        chunk = following
+    complete = chunk is None and not failed
+    chunks.close()
+
+    if len(builder) == 0:
+        return result, []
+
+    table_list = [chatgpt_table(chatgpt.build(builder, TABLE_BACKEND), terms)]
+    if complete and EXTRACTION_CACHE is not None:
+        EXTRACTION_CACHE.put(cache_key or chatgpt_cache_key(chatgpt_zip), table_list)
+    return result, table_list
+
+
+
+def chatgpt_cache_key(chatgpt_zip: str | unzipddp.DDPArchive) -> str:
+    return cache.key(
+        "chatgpt", cache.fingerprint(chatgpt_zip), TRAVERSAL, TABLE_BACKEND, TABLE_PAGE_SIZE, TABLE_DATA_FORMAT
+    )
+
+
+
+def extract_chatgpt_cached(
+    chatgpt_zip: str | unzipddp.DDPArchive, cache_key: str | None = None
+) -> list[props.PropsUIPromptConsentFormTable]:
+    """
+    extract_chatgpt, or its result for an earlier selected export with the same fingerprint
+    cache_key is computed from the zip when it is not given, see chatgpt_cache_key
+    Without a CACHE_DIRECTORY this is extract_chatgpt
+    """
+    if EXTRACTION_CACHE is None:
+        return extract_chatgpt(chatgpt_zip)
+    if cache_key is None:
+        cache_key = chatgpt_cache_key(chatgpt_zip)
+    return EXTRACTION_CACHE.get_or_compute(cache_key, lambda: extract_chatgpt(chatgpt_zip))
+
+
+
 def render_end_page():
     page = props.PropsUIPageEnd()
     return CommandUIRender(page)
 
 
 
+def render_table_page(table_list: list[props.PropsUIPromptConsentFormTable], request: str):
+    """
+    Answers a page request for a paged consent form table
+    request is a json string: {"table_id": <id of the table>, "page": <page number starting at 0>}
+
+    The request comes from the host, invalid requests and unknown tables are logged and get an empty page
+    """
+    try:
+        request_data = json.loads(request)
+        table_id = str(request_data["table_id"])
+        page = int(request_data["page"])
+    except (TypeError, ValueError, KeyError) as e:
+        LOGGER.error("Invalid table page request: %s", e)
+        return CommandUITablePage(props.PropsUITablePage("", 0, 0, 0, Table(), TABLE_DATA_FORMAT))
+
+    table = next((table for table in table_list if table.id == table_id), None)
+    if table is None:
+        LOGGER.error("Page requested of unknown table: %s", table_id)
+        return CommandUITablePage(props.PropsUITablePage(table_id, page, 0, 0, Table(), TABLE_DATA_FORMAT))
+
+    return CommandUITablePage(table.get_page(page))
+
+
+
 def render_page(header_text, body):
     header = props.PropsUIHeader(header_text)
 
@@ -201,5 +428,10 @@ def generate_file_prompt(extensions):
 def donate(key, json_string):
     return CommandSystemDonate(key, json_string)
 
+def donate_chunked(key, json_string):
+    if DONATION_CHUNK_SIZE is None:
+        return [donate(key, json_string)]
+    return split_donation(key, json_string, chunk_size=DONATION_CHUNK_SIZE, compress=True)
+
 def exit(code, info):
     return CommandSystemExit(code, info)
@@ -0,0 +1,66 @@
+"""
+Term frequencies for text visualizations, computed in Python
+
+The visualization plugin can tokenize a text column itself,
+but it does so for every row of the table, which freezes the page for large tables.
+TermFrequencies computes the top terms once, in the same shape as the plugin (ScoredTerm),
+so they can be send along with the visualization
+"""
+
+from collections import Counter
+from typing import Iterable
+import heapq
+import math
+import re
+import string
+
+import port.stopwords as stopwords
+
+# A token should contain at least one letter
+_HAS_LETTER = re.compile(r"[^\W\d_]")
+_PUNCTUATION = string.punctuation + "“”‘’«»…"
+
+
+class TermFrequencies:
+    """
+    Counts of terms over a collection of texts
+
+    Texts are tokenized on whitespace, lowercased, stripped of punctuation
+    and stopwords are removed, the same as tokenize in the plugin (visualizationDataFunctions/util.ts).
+    The plugin recomputes the terms once rows are deleted, with the same tokens the cloud does not change shape
+    """
+
+    def __init__(self, stopwords: frozenset[str] = stopwords.ALL):
+        self.stopwords = stopwords
+        self.values: Counter[str] = Counter()
+        self.doc_freqs: Counter[str] = Counter()
+        self.n_docs = 0
+
+    def tokenize(self, text: str) -> list[str]:
+        tokens = (token.strip(_PUNCTUATION) for token in text.lower().split())
+        return [
+            token for token in tokens
+            if token not in self.stopwords and _HAS_LETTER.search(token)
+        ]
+
+    def add(self, texts: Iterable[str]) -> None:
+        for text in texts:
+            if not isinstance(text, str):
+                continue
+            tokens = self.tokenize(text)
+            self.values.update(tokens)
+            self.doc_freqs.update(set(tokens))
+            self.n_docs += 1
+
+    def top_terms(self, n: int = 200) -> list[dict[str, float | str]]:
+        """
+        The n terms with the highest importance (tf * idf), like the visualization plugin computes it
+        """
+        def importance(term: str) -> float:
+            return self.values[term] * math.log(self.n_docs / self.doc_freqs[term])
+
+        top = heapq.nlargest(n, self.values, key=importance)
+        return [
+            {"text": term, "value": self.values[term], "importance": importance(term)}
+            for term in top
+        ]
@@ -0,0 +1,153 @@
+"""
+Contains the tracking data that is donated alongside the data of the participant:
+log records and the timings of the stages of the donation flow
+"""
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Any, ContextManager, Iterator
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RingBufferHandler(logging.Handler):
+    """
+    Logging handler that keeps the last capacity records as structured dicts
+
+    collect() returns the records that were added since the previous call,
+    so every record is donated only once. Memory stays bounded:
+    records that are pushed out of the buffer before being collected are counted as dropped
+    """
+
+    def __init__(self, capacity: int = 1000, level: int = logging.NOTSET):
+        super().__init__(level)
+        self.records: deque[dict[str, Any]] = deque(maxlen=capacity)
+        self.n_emitted = 0
+        self.n_collections = 0
+        self.cursor = 0
+
+    def format_time(self, record: logging.LogRecord) -> str:
+        if self.formatter is not None:
+            return self.formatter.formatTime(record, self.formatter.datefmt)
+        return datetime.fromtimestamp(record.created, timezone.utc).isoformat()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.records.append({
+                "seq": self.n_emitted,
+                "time": self.format_time(record),
+                "name": record.name,
+                "level": record.levelname,
+                "message": record.getMessage(),
+            })
+            self.n_emitted += 1
+        except Exception:
+            self.handleError(record)
+
+    def collect(self) -> tuple[list[dict[str, Any]], int]:
+        """
+        Returns the records added since the previous call
+        and the number of records that were dropped before they could be collected
+        """
+        with self.lock:  # type: ignore
+            first_available = self.n_emitted - len(self.records)
+            dropped = max(0, first_available - self.cursor)
+            new = list(islice(self.records, max(0, self.cursor - first_available), None))
+            self.cursor = self.n_emitted
+            self.n_collections += 1
+
+        return new, dropped
+
+    def reset(self) -> None:
+        """
+        Forgets all records, for running several sessions in one process
+        """
+        with self.lock:  # type: ignore
+            self.records.clear()
+            self.n_emitted = 0
+            self.n_collections = 0
+            self.cursor = 0
+
+
+@dataclass
+class Span:
+    """
+    Wall time of a stage of the donation flow
+
+    Attributes:
+        name: name of the stage, by convention <module>.<stage>
+        seconds: wall time
+        input_bytes: optional size of the input of the stage
+        rows: optional number of rows produced by the stage
+    """
+
+    name: str
+    seconds: float = 0.0
+    input_bytes: int | None = None
+    rows: int | None = None
+
+
+class Timings:
+    """
+    Collects the spans of a session
+    """
+
+    def __init__(self):
+        self.spans: list[Span] = []
+
+    @contextmanager
+    def span(self, name: str, input_bytes: int | None = None) -> Iterator[Span]:
+        """
+        Times the body of the with statement,
+        rows and input_bytes can be set on the yielded span
+        """
+        span = Span(name, input_bytes=input_bytes)
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.seconds = time.perf_counter() - start
+            self.spans.append(span)
+            logger.debug("%s took %.3fs", name, span.seconds)
+
+    def add(self, span: Span) -> None:
+        """
+        Adds a span that was timed by the caller, for example the time spent inside a generator
+        """
+        self.spans.append(span)
+
+    def reset(self) -> None:
+        self.spans = []
+
+    def summary(self) -> dict[str, dict[str, Any]]:
+        """
+        Compact summary per stage: number of spans, total and maximum seconds, total bytes and rows
+        """
+        out: dict[str, dict[str, Any]] = {}
+        for span in self.spans:
+            stage = out.setdefault(span.name, {"n": 0, "seconds": 0.0, "max_seconds": 0.0, "bytes": 0, "rows": 0})
+            stage["n"] += 1
+            stage["seconds"] += span.seconds
+            stage["max_seconds"] = max(stage["max_seconds"], span.seconds)
+            stage["bytes"] += span.input_bytes or 0
+            stage["rows"] += span.rows or 0
+
+        for stage in out.values():
+            stage["seconds"] = round(stage["seconds"], 3)
+            stage["max_seconds"] = round(stage["max_seconds"], 3)
+
+        return out
+
+
+TIMINGS = Timings()
+
+
+def span(name: str, input_bytes: int | None = None) -> ContextManager[Span]:
+    """
+    Times a stage of the donation flow in the timings of this session, see Timings.span
+    """
+    return TIMINGS.span(name, input_bytes)
@@ -2,21 +2,124 @@
 Contains functions to deal with zipfiles
 """
 
+from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
-from typing import Any, Callable
+from typing import TYPE_CHECKING, Any, Callable, IO, Iterator
+import codecs
 import logging
 import zipfile
 import json
 import csv
 import io
-
-import pandas as pd
+import os
+import re
+import time
 
 from port.my_exceptions import FileNotFoundInZipError
+import port.tracking as tracking
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 logger = logging.getLogger(__name__)
 
-def extract_file_from_zip(zfile: str, file_to_extract: str) -> io.BytesIO:
+
+def _file_size(path: str) -> int | None:
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return None
+
+
+class DDPArchive:
+    """
+    Zipfile session shared by validation and extraction
+
+    The zip is opened once, on first use, and an index from file name to ZipInfo is built.
+    Opening a bad zipfile raises zipfile.BadZipFile at that moment.
+    When the same name occurs in multiple folders, the first one in the zip is used
+    """
+
+    def __init__(self, zfile: str):
+        self.zfile = zfile
+        self._zf: zipfile.ZipFile | None = None
+        self._index: dict[str, zipfile.ZipInfo] = {}
+
+    @property
+    def zf(self) -> zipfile.ZipFile:
+        if self._zf is None:
+            with tracking.span("unzipddp.open_archive", input_bytes=_file_size(self.zfile)):
+                zf = zipfile.ZipFile(self.zfile, "r")
+                for info in zf.infolist():
+                    self._index.setdefault(Path(info.filename).name, info)
+            self._zf = zf
+        return self._zf
+
+    def infolist(self) -> list[zipfile.ZipInfo]:
+        return self.zf.infolist()
+
+    def size(self) -> int | None:
+        """
+        Size of the zip file in bytes, None when it is not a file on disk
+        """
+        return _file_size(self.zfile)
+
+    def names(self) -> list[str]:
+        """
+        File names (without folders) of all unique files in the zip
+        """
+        self.zf
+        return list(self._index.keys())
+
+    def getinfo(self, file_name: str) -> zipfile.ZipInfo:
+        """
+        Looks up a file in the zip by its name without folders
+        """
+        self.zf
+        info = self._index.get(file_name)
+        if info is None:
+            raise FileNotFoundInZipError("File not found in zip")
+        return info
+
+    def open(self, file_name: str) -> IO[bytes]:
+        """
+        Opens a file in the zip as a stream, without reading it into memory
+        """
+        return self.zf.open(self.getinfo(file_name), "r")
+
+    def read(self, file_name: str) -> bytes:
+        info = self.getinfo(file_name)
+        with tracking.span("unzipddp.read", input_bytes=info.file_size):
+            return self.zf.read(info)
+
+    def close(self) -> None:
+        if self._zf is not None:
+            self._zf.close()
+            self._zf = None
+            self._index = {}
+
+    def __enter__(self) -> "DDPArchive":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+@contextmanager
+def open_archive(zfile: str | DDPArchive) -> Iterator[DDPArchive]:
+    """
+    Use an existing DDPArchive or open a path as a DDPArchive
+    Only archives opened here are closed afterwards
+    """
+    if isinstance(zfile, DDPArchive):
+        yield zfile
+    else:
+        with DDPArchive(zfile) as archive:
+            yield archive
+
+
+def extract_file_from_zip(zfile: str | DDPArchive, file_to_extract: str) -> io.BytesIO:
     """
     Extracts a specific file from a zipfile buffer
     Function always returns a buffer
@@ -24,20 +127,8 @@ def extract_file_from_zip(zfile: str, file_to_extract: str) -> io.BytesIO:
     file_to_extract_bytes = io.BytesIO()
 
     try:
-        with zipfile.ZipFile(zfile, "r") as zf:
-            file_found = False
-
-            for f in zf.namelist():
-                logger.debug("Contained in zip: %s", f)
-                if Path(f).name == file_to_extract:
-                    #print('extract_file_from_zip found a message json', f)
-
-                    file_to_extract_bytes = io.BytesIO(zf.read(f))
-                    file_found = True
-                    break
-
-        if not file_found:
-            raise FileNotFoundInZipError("File not found in zip")
+        with open_archive(zfile) as archive:
+            file_to_extract_bytes = io.BytesIO(archive.read(file_to_extract))
 
     except zipfile.BadZipFile as e:
         logger.error("BadZipFile:  %s", e)
@@ -50,47 +141,181 @@ def extract_file_from_zip(zfile: str, file_to_extract: str) -> io.BytesIO:
         return file_to_extract_bytes
 
 
-def _json_reader_bytes(json_bytes: bytes, encoding: str) -> Any:
-    json_bytes_stream = io.BytesIO(json_bytes)
-    stream = io.TextIOWrapper(json_bytes_stream, encoding=encoding)
-    result = json.load(stream)
-    return result
+# Whitespace between the tokens of a json document
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+# Characters that can continue a number, a number followed only by these can be incomplete
+_NUMBER_TAIL = re.compile(r"[0-9.eE+-]*")
+
+# What iter_json_array expects next
+_EXPECT_ARRAY = 0
+_EXPECT_FIRST = 1
+_EXPECT_ELEMENT = 2
+_EXPECT_SEPARATOR = 3
+_EXPECT_END = 4
+
+
+def iter_json_array(stream: io.TextIOBase, chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """
+    Incrementally reads a json document that is an array from a text stream
+    and yields its elements one at a time
+
+    Only the element currently being decoded is held in memory,
+    when an element does not fit in the buffer, the read size is doubled until it does
+
+    Raises ValueError (json.JSONDecodeError for invalid elements) when the document is not a valid json array,
+    the elements before the error have been yielded by then
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+    read_size = chunk_size
+    expect = _EXPECT_ARRAY
+
+    while True:
+        pos = _WHITESPACE.match(buffer, pos).end()  # type: ignore
+
+        if pos < len(buffer):
+            char = buffer[pos]
+
+            if expect == _EXPECT_ARRAY:
+                if char != "[":
+                    raise ValueError("Expected a json array")
+                expect = _EXPECT_FIRST
+                pos += 1
+                continue
+
+            if expect == _EXPECT_END:
+                raise ValueError("Unexpected data after the json array")
+
+            if expect == _EXPECT_SEPARATOR or (expect == _EXPECT_FIRST and char == "]"):
+                if char == ",":
+                    expect = _EXPECT_ELEMENT
+                elif char == "]":
+                    expect = _EXPECT_END
+                else:
+                    raise ValueError(f"Expected ',' or ']' in json array, got {char!r}")
+                pos += 1
+                continue
+
+            try:
+                obj, end = decoder.raw_decode(buffer, pos)
+                # A number followed by nothing but characters of a number could continue in the next read,
+                # raw_decode("123.") returns 123
+                incomplete = (
+                    not eof
+                    and isinstance(obj, (int, float))
+                    and not isinstance(obj, bool)
+                    and _NUMBER_TAIL.match(buffer, end).end() == len(buffer)  # type: ignore
+                )
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                incomplete = True
+
+            if not incomplete:
+                yield obj
+                pos = end
+                expect = _EXPECT_SEPARATOR
+                read_size = chunk_size
+                continue
+
+            read_size *= 2
+
+        elif eof:
+            if expect == _EXPECT_END:
+                return
+            raise ValueError("Unexpected end of json array")
+
+        buffer = buffer[pos:]
+        pos = 0
+        data = stream.read(read_size)
+        eof = not data
+        buffer += data
+
+
+_END = object()
+
+
+def iter_json_array_from_zip(zfile: str | DDPArchive, file_to_extract: str) -> Iterator[Any]:
+    """
+    Streams the elements of a json array contained in a zipfile
+    without reading the whole file into memory
+
+    The first file in the zip with the name file_to_extract is used
+    Yields nothing if the file cannot be found
+
+    The encoding is sniffed from the first bytes, like read_json_from_bytes does
+    """
+    try:
+        with open_archive(zfile) as archive, archive.open(file_to_extract) as raw:
+            encoding = json.detect_encoding(raw.peek(4)[:4])
+            logger.debug("Streaming json with encoding: %s", encoding)
+            stream = io.TextIOWrapper(raw, encoding=encoding)
+            elements = iter_json_array(stream)
+
+            # Only the time spent reading and decoding is tracked, not the time of the caller
+            span = tracking.Span("unzipddp.stream_json", input_bytes=archive.getinfo(file_to_extract).file_size)
+            try:
+                while True:
+                    start = time.perf_counter()
+                    element = next(elements, _END)
+                    span.seconds += time.perf_counter() - start
+                    if element is _END:
+                        break
+                    yield element
+            finally:
+                tracking.TIMINGS.add(span)
+
+    except zipfile.BadZipFile as e:
+        logger.error("BadZipFile:  %s", e)
+    except FileNotFoundInZipError as e:
+        logger.error("File not found:  %s: %s", file_to_extract, e)
+
+
+def _json_reader_bytes(json_bytes: bytes | memoryview) -> Any:
+    """
+    Parses json bytes in one pass: the encoding is sniffed from the first bytes
+    (utf-8, utf-16 or utf-32, with or without byte order mark), the bytes are decoded once
+    and parsed as a str, without intermediate streams or copies of the bytes
+    """
+    encoding = json.detect_encoding(bytes(json_bytes[:4]))
+    logger.debug("Decoding json bytes with encoding: %s", encoding)
+    if encoding == "utf-8-sig":
+        # skipping the byte order mark is cheaper than the utf-8-sig codec
+        json_bytes = memoryview(json_bytes)[len(codecs.BOM_UTF8):]
+        encoding = "utf-8"
+    return json.loads(str(json_bytes, encoding))
 
 
-def _json_reader_file(json_file: str, encoding: str) -> Any:
-    with open(json_file, 'r', encoding=encoding) as f:
-        result = json.load(f)
-    return result
+def _json_reader_file(json_file: str) -> Any:
+    with open(json_file, "rb") as f:
+        return _json_reader_bytes(f.read())
 
 
-def _read_json(json_input: Any, json_reader: Callable[[Any, str], Any]) -> dict[Any, Any] | list[Any]:
+def _read_json(json_input: Any, json_reader: Callable[[Any], Any]) -> dict[Any, Any] | list[Any]:
     """
     Dunder function that read json_input and applies json_reader
-    Performs several checks (see code) and tries different encodings
+    Checks that the result is a list or dict
     """
 
     out: dict[Any, Any] | list[Any] = {}
 
-    encodings = ["utf8", "utf-8-sig"]
-    for encoding in encodings:
-        try:
-            result = json_reader(json_input, encoding)
+    try:
+        result = json_reader(json_input)
 
-            if not isinstance(result, (dict, list)):
-                raise TypeError("Did not convert bytes to a list or dict, but to another type instead")
+        if not isinstance(result, (dict, list)):
+            raise TypeError("Did not convert bytes to a list or dict, but to another type instead")
 
-            out = result
-            logger.debug("Succesfully converted json bytes with encoding: %s", encoding)
-            break
+        out = result
 
-        except json.JSONDecodeError:
-            logger.error("Cannot decode json with encoding: %s", encoding)
-        except TypeError as e:
-            logger.error("%s, could not convert json bytes", e)
-            break
-        except Exception as e:
-            logger.error("%s, could not convert json bytes", e)
-            break
+    except json.JSONDecodeError as e:
+        logger.error("Cannot decode json: %s", e)
+    except UnicodeDecodeError as e:
+        logger.error("%s, could not decode json bytes", e)
+    except Exception as e:
+        logger.error("%s, could not convert json bytes", e)
 
     return out
 
@@ -100,13 +325,16 @@ def read_json_from_bytes(json_bytes: io.BytesIO) -> dict[Any, Any] | list[Any]:
     Reads json from io.BytesIO buffer
     this function is a wrapper around _read_json
 
+    The json is parsed from the buffer of json_bytes, which is not copied
+
     Function returns {} in case of failure
     """
 
     out: dict[Any, Any] | list[Any] = {}
     try:
-        b = json_bytes.read()
-        out = _read_json(b, _json_reader_bytes)
+        with json_bytes.getbuffer() as buffer, buffer[json_bytes.tell():] as b:
+            with tracking.span("unzipddp.read_json", input_bytes=len(b)):
+                out = _read_json(b, _json_reader_bytes)
     except Exception as e:
         logger.error("%s, could not convert json bytes", e)
 
@@ -128,16 +356,19 @@ def read_csv_from_bytes(json_bytes: io.BytesIO) -> list[dict[Any, Any]]:
     """
     Reads csv from io.Bytes()
     Expects input from extract_file_from_zip
+
+    For large files use iter_csv_columns_from_zip or iter_csv_from_zip,
+    they do not keep a dict per row
     """
     out: list[dict[Any, Any]] = []
 
-    b = json_bytes.read()
-
     try:
-        stream = io.TextIOWrapper(io.BytesIO(b), encoding="utf8")
-        reader = csv.DictReader(stream)
-        for row in reader:
-            out.append(row)
+        # Decodes straight from the buffer, detach keeps json_bytes open
+        stream = io.TextIOWrapper(json_bytes, encoding="utf8", newline="")
+        try:
+            out.extend(csv.DictReader(stream))
+        finally:
+            stream.detach()
         logger.debug("succesfully converted csv bytes with encoding utf8")
 
     except Exception as e:
@@ -147,11 +378,144 @@ def read_csv_from_bytes(json_bytes: io.BytesIO) -> list[dict[Any, Any]]:
         return out
 
 
-def read_csv_from_bytes_to_df(json_bytes: io.BytesIO) -> pd.DataFrame:
+def read_csv_from_bytes_to_df(json_bytes: io.BytesIO) -> "pd.DataFrame":
     """
     csv to pd.DataFrame
     expects io.BytesIO as input (from extract_file_from_zip)
     """
+    import pandas as pd
+
     return pd.DataFrame(read_csv_from_bytes(json_bytes))
 
 
+# Encodings tried in order when streaming csv, latin-1 decodes any bytes so it is the last resort
+CSV_ENCODINGS = ("utf-8-sig", "latin-1")
+
+CSV_BATCH_SIZE = 10_000
+
+
+def _csv_column_batches(
+    stream: IO[str], batch_size: int, header: list[str] | None = None
+) -> Iterator[dict[str, list[str | None]]]:
+    # header replaces the column names in the file, the first line is still skipped
+    reader = csv.reader(stream)
+    file_header = next(reader, None)
+    if file_header is None:
+        return
+    header = header or file_header
+
+    while rows := list(islice(reader, batch_size)):
+        columns: dict[str, list[str | None]] = {name: [] for name in header}
+        buffers = list(columns.values())
+        for row in rows:
+            # Like csv.DictReader: missing fields are None, extra fields are dropped
+            for i, buffer in enumerate(buffers):
+                buffer.append(row[i] if i < len(row) else None)
+        yield columns
+
+
+def _csv_dataframe_batches(
+    stream: IO[str], batch_size: int, header: list[str] | None = None
+) -> Iterator["pd.DataFrame"]:
+    import pandas as pd
+
+    # Every value as a string, empty fields as empty strings, like read_csv_from_bytes_to_df
+    # header replaces the column names in the file, the first line is still skipped
+    # usecols drops the fields past the header, without it pandas skips such rows, but not at the start of a chunk
+    try:
+        with pd.read_csv(
+            stream, dtype=str, keep_default_na=False, chunksize=batch_size, on_bad_lines="skip",
+            header=0, names=header, usecols=lambda column: True,
+        ) as chunks:
+            yield from chunks
+    except pd.errors.EmptyDataError:
+        return
+
+
+def _iter_csv_from_zip(
+    zfile: str | DDPArchive,
+    file_to_extract: str,
+    read_batches: Callable[[IO[str], int, list[str] | None], Iterator[Any]],
+    batch_size: int,
+    encodings: tuple[str, ...],
+) -> Iterator[Any]:
+    """
+    Streams batches of a csv file in a zip, decoding with the first encoding that works
+
+    When decoding fails halfway the file is read again with the next encoding,
+    batches that were already yielded are skipped. The columns of the batches that follow are named
+    like those of the first batch, the header could decode differently with the next encoding.
+    A utf-8 byte order mark is skipped whatever the encoding
+    """
+    n_yielded = 0
+    header = None
+    try:
+        with open_archive(zfile) as archive:
+            span = tracking.Span("unzipddp.stream_csv", input_bytes=archive.getinfo(file_to_extract).file_size)
+            try:
+                for encoding in encodings:
+                    try:
+                        with archive.open(file_to_extract) as raw:
+                            if raw.peek(3)[:3] == codecs.BOM_UTF8:
+                                raw.read(3)
+                            stream = io.TextIOWrapper(raw, encoding=encoding, newline="")
+                            batches = read_batches(stream, batch_size, header)
+                            n_batch = 0
+                            while True:
+                                # Only the time spent reading and decoding is tracked, not the time of the caller
+                                start = time.perf_counter()
+                                batch = next(batches, _END)
+                                span.seconds += time.perf_counter() - start
+                                if batch is _END:
+                                    break
+                                n_batch += 1
+                                if n_batch > n_yielded:
+                                    n_yielded += 1
+                                    if header is None:
+                                        header = [str(column) for column in batch]
+                                    yield batch
+                        logger.debug("Read csv %s with encoding %s", file_to_extract, encoding)
+                        return
+                    except UnicodeDecodeError as e:
+                        logger.info("Could not decode %s with encoding %s: %s", file_to_extract, encoding, e)
+                logger.error("Could not decode %s with any of the encodings: %s", file_to_extract, encodings)
+            finally:
+                tracking.TIMINGS.add(span)
+
+    except zipfile.BadZipFile as e:
+        logger.error("BadZipFile:  %s", e)
+    except FileNotFoundInZipError as e:
+        logger.error("File not found:  %s: %s", file_to_extract, e)
+
+
+def iter_csv_columns_from_zip(
+    zfile: str | DDPArchive,
+    file_to_extract: str,
+    batch_size: int = CSV_BATCH_SIZE,
+    encodings: tuple[str, ...] = CSV_ENCODINGS,
+) -> Iterator[dict[str, list[str | None]]]:
+    """
+    Streams a csv file in a zip in batches of batch_size rows, without pandas
+    A batch is a list of values per column: {column name: [values]}
+
+    Every value is a string, missing fields are None, like read_csv_from_bytes
+    Yields nothing if the file cannot be found or decoded
+    """
+    return _iter_csv_from_zip(zfile, file_to_extract, _csv_column_batches, batch_size, encodings)
+
+
+def iter_csv_from_zip(
+    zfile: str | DDPArchive,
+    file_to_extract: str,
+    chunk_size: int = CSV_BATCH_SIZE,
+    encodings: tuple[str, ...] = CSV_ENCODINGS,
+) -> Iterator["pd.DataFrame"]:
+    """
+    Streams a csv file in a zip as DataFrames of chunk_size rows, parsed with pd.read_csv
+
+    Every column is a string column and empty fields are empty strings, like read_csv_from_bytes_to_df.
+    Missing fields are empty strings too, fields past the header are dropped like iter_csv_columns_from_zip does.
+    The row index continues over the chunks, pd.concat of all chunks is the complete table
+    Yields nothing if the file cannot be found or decoded
+    """
+    return _iter_csv_from_zip(zfile, file_to_extract, _csv_dataframe_batches, chunk_size, encodings)
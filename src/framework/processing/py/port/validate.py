@@ -3,11 +3,18 @@ Contains classes to deal with input validation of DDPs
 """
 from dataclasses import dataclass, field
 from enum import Enum
+from typing import Iterable, Iterator
 
 import logging
 
 logger = logging.getLogger(__name__)
 
+# A category is accepted from this score: the percentage of the weight of its known files that was found
+MIN_SCORE = 5
+
+# Scanning the files stops when a category reaches this score, nothing beats a complete match
+EARLY_STOP_SCORE = 100
+
 
 class Language(Enum):
     """ Languages Enum """
@@ -31,6 +38,90 @@ class DDPCategory:
     ddp_filetype: DDPFiletype
     language: Language
     known_files: list[str]
+    weights: dict[str, float] = field(default_factory=dict)
+
+    def weight(self, known_file: str) -> float:
+        """
+        Weight of a known file in the score of the category, 1 unless set in weights
+        """
+        return self.weights.get(known_file, 1.0)
+
+
+class SignatureIndex:
+    """
+    Hash map from the known files of DDP categories to the categories that contain them
+
+    A known file is a file name ("conversations.json") or the end of a path ("YouTube/history/watch-history.json"),
+    it matches every file in the zip whose path ends with it.
+    Looking up a file costs one dict lookup per folder level used in the known files,
+    independent of the number of categories and known files
+    """
+
+    def __init__(self, categories: Iterable[DDPCategory]):
+        self.signatures: dict[str, list[tuple[str, float]]] = {}
+        self.total_weight: dict[str, float] = {}
+        self.max_depth = 1
+
+        for category in categories:
+            total = 0.0
+            for known_file in dict.fromkeys(category.known_files):
+                weight = category.weight(known_file)
+                signature = known_file.strip("/")
+                self.signatures.setdefault(signature, []).append((category.id, weight))
+                self.max_depth = max(self.max_depth, signature.count("/") + 1)
+                total += weight
+            self.total_weight[category.id] = total
+
+    def match(self, path: str) -> Iterator[tuple[str, str, float]]:
+        """
+        Yields (known file, category id, weight) for every known file the path ends with
+        """
+        parts = path.rstrip("/").split("/")
+        for depth in range(1, min(self.max_depth, len(parts)) + 1):
+            signature = "/".join(parts[-depth:])
+            for category_id, weight in self.signatures.get(signature, ()):
+                yield signature, category_id, weight
+
+    def score(self, paths: Iterable[str], early_stop: float = EARLY_STOP_SCORE) -> dict[str, float]:
+        """
+        Score per category: percentage of the weight of its known files found in paths
+        Every known file counts once. Stops reading paths when a category reaches early_stop
+        """
+        found: set[tuple[str, str]] = set()
+        weights: dict[str, float] = {}
+        scores: dict[str, float] = {}
+
+        for path in paths:
+            for signature, category_id, weight in self.match(path):
+                if (category_id, signature) in found:
+                    continue
+                found.add((category_id, signature))
+                logger.debug("Found: %s in zip", path)
+
+                weights[category_id] = weights.get(category_id, 0.0) + weight
+                total = self.total_weight[category_id]
+                scores[category_id] = weights[category_id] / total * 100 if total else 0.0
+                if scores[category_id] >= early_stop:
+                    return scores
+
+        return scores
+
+
+_SIGNATURE_INDEXES: dict[tuple, SignatureIndex] = {}
+
+
+def signature_index(categories: list[DDPCategory]) -> SignatureIndex:
+    """
+    Signature index of categories, built once per distinct list of categories
+    """
+    key = tuple(
+        (category.id, tuple(category.known_files), tuple(sorted(category.weights.items())))
+        for category in categories
+    )
+    index = _SIGNATURE_INDEXES.get(key)
+    if index is None:
+        index = _SIGNATURE_INDEXES[key] = SignatureIndex(categories)
+    return index
 
 
 @dataclass
@@ -54,23 +145,24 @@ class ValidateInput:
     status_code: StatusCode | None = None
     ddp_category: DDPCategory | None = None
 
+    early_stop: float = EARLY_STOP_SCORE
+
     ddp_categories_lookup: dict[str, DDPCategory] = field(init=False)
     status_codes_lookup: dict[int, StatusCode] = field(init=False)
+    signature_index: SignatureIndex = field(init=False)
 
-    def infer_ddp_category(self, file_list_input: list[str]) -> bool:
+    def infer_ddp_category(self, file_list_input: Iterable[str]) -> bool:
         """
-        Compares a list of files to a list of known files.
+        Compares a list of files to the known files of the categories, see SignatureIndex.
         From that comparison infer the DDP Category
-        Note: at least 5% percent of known files should match
+        Note: at least MIN_SCORE percent of the (weighted) known files should match
+
+        file_list_input can be file names or paths in the zip, and a generator:
+        it is only read until a category matches completely
         """
-        prop_category = {}
-        for identifier, category in self.ddp_categories_lookup.items():
-            n_files_found = [
-                1 if f in category.known_files else 0 for f in file_list_input
-            ]
-            prop_category[identifier] = sum(n_files_found) / len(category.known_files) * 100
-
-        if max(prop_category.values()) >= 5:
+        prop_category = self.signature_index.score(file_list_input, self.early_stop)
+
+        if prop_category and max(prop_category.values()) >= MIN_SCORE:
             highest = max(prop_category, key=prop_category.get)  # type: ignore
             self.ddp_category = self.ddp_categories_lookup[highest]
             logger.info("Detected DDP category: %s", self.ddp_category.id)
@@ -96,3 +188,4 @@ class ValidateInput:
         self.status_codes_lookup = {
             status_code.id: status_code for status_code in self.status_codes
         }
+        self.signature_index = signature_index(self.ddp_categories)
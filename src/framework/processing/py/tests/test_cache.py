@@ -0,0 +1,97 @@
+import zipfile
+
+import pytest
+
+import port.cache as cache
+import port.script as script
+from port.batch import run_session
+
+from benchmarks.generate import ExportSpec, generate_export, parse_size
+
+
+def test_lru_eviction():
+    extraction_cache = cache.ExtractionCache(max_entries=2)
+    extraction_cache.put("a", [1])
+    extraction_cache.put("b", [2])
+    assert extraction_cache.get("a") == [1]
+
+    # b is the least recently used now
+    extraction_cache.put("c", [3])
+    assert list(extraction_cache.entries) == ["a", "c"]
+    assert extraction_cache.get("b") is None
+    assert (extraction_cache.hits, extraction_cache.misses) == (1, 1)
+
+
+def test_directory_round_trip(tmp_path):
+    directory = tmp_path / "cache"
+    first = cache.ExtractionCache(max_entries=1, directory=directory)
+    first.put("a", {"rows": [1, 2]})
+    first.put("b", {"rows": [3]})
+    assert list(first.entries) == ["b"]
+    assert sorted(path.name for path in directory.iterdir()) == ["a.pickle", "b.pickle"]
+
+    # a new worker only has the directory
+    second = cache.ExtractionCache(max_entries=1, directory=directory)
+    assert second.get("a") == {"rows": [1, 2]}
+    assert list(second.entries) == ["a"]
+    assert second.get("missing") is None
+    assert (second.hits, second.misses) == (1, 1)
+
+
+def test_unreadable_entry_is_a_miss(tmp_path):
+    (tmp_path / "a.pickle").write_bytes(b"not a pickle")
+    assert cache.ExtractionCache(directory=tmp_path).get("a") is None
+
+
+@pytest.mark.parametrize("value, store, cached", [
+    ([], bool, False),
+    ([1], bool, True),
+    ([], lambda value: True, True),
+    ([1], lambda value: False, False),
+])
+def test_get_or_compute_store(value, store, cached):
+    extraction_cache = cache.ExtractionCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return value
+
+    assert extraction_cache.get_or_compute("a", compute, store) == value
+    assert ("a" in extraction_cache.entries) == cached
+    extraction_cache.get_or_compute("a", compute, store)
+    assert len(calls) == (1 if cached else 2)
+
+
+def write_zip(path, comment=b""):
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("conversations.json", "[]")
+        z.comment = comment
+    return str(path)
+
+
+def test_fingerprint_includes_the_archive_size(tmp_path):
+    a = write_zip(tmp_path / "a.zip")
+    assert cache.fingerprint(a) == cache.fingerprint(write_zip(tmp_path / "b.zip"))
+    # same members, different size
+    assert cache.fingerprint(a) != cache.fingerprint(write_zip(tmp_path / "c.zip", b"comment"))
+
+
+def test_batch_sessions_share_the_cache_directory(tmp_path, monkeypatch):
+    # the sessions replace the cache of the script
+    monkeypatch.setattr(script, "CACHE_DIRECTORY", None)
+    monkeypatch.setattr(script, "EXTRACTION_CACHE", None)
+    path = str(generate_export(tmp_path / "export.zip", ExportSpec(size=parse_size("50KB"), seed=1)).path)
+
+    uncached = run_session("uncached", path, tmp_path / "out")
+    assert script.EXTRACTION_CACHE is None
+
+    directory = str(tmp_path / "cache")
+    first = run_session("first", path, tmp_path / "out", cache_directory=directory)
+    second = run_session("second", path, tmp_path / "out", cache_directory=directory)
+    assert script.EXTRACTION_CACHE is not None and script.EXTRACTION_CACHE.hits == 1
+
+    def donation(result):
+        return (tmp_path / "out" / result.session_id / f"{result.session_id}-ChatGPT.json").read_text()
+
+    assert donation(first) == donation(second) == donation(uncached)
@@ -0,0 +1,194 @@
+import copy
+
+import pytest
+
+import port.chatgpt as chatgpt
+from port.helpers import unix_timestamps_to_datetimes
+
+from benchmarks.generate import ExportSpec, _ConversationFactory, generate_export, parse_size
+
+
+def message(role="user", parts=("Hi",), metadata=None, **fields):
+    return {
+        "id": "aaaaaaaa-0000-4000-8000-000000000000",
+        "author": {"role": role, "name": None, "metadata": {}},
+        "create_time": 1700000000.5,
+        "update_time": None,
+        "content": {"content_type": "text", "parts": list(parts)},
+        "status": "finished_successfully",
+        "end_turn": None,
+        "weight": 1.0,
+        "metadata": metadata if metadata is not None else {},
+        "recipient": "all",
+        **fields,
+    }
+
+
+def node(message):
+    return {"id": "bbbbbbbb-0000-4000-8000-000000000000", "message": message, "parent": None, "children": []}
+
+
+def normalized(datapoint):
+    # the direct path keeps create_time as is, the denested path as a string, both convert to the same datetime
+    if datapoint is None:
+        return None
+    return {**datapoint, "time": unix_timestamps_to_datetimes([datapoint["time"]])[0]}
+
+
+def assert_same_row(turn, direct=True):
+    denested = chatgpt._turn_to_datapoint_denested("title", copy.deepcopy(turn))
+    assert normalized(chatgpt.turn_to_datapoint("title", turn)) == normalized(denested)
+    if direct:
+        # the fast path is used, not the fallback
+        assert normalized(chatgpt._turn_to_datapoint_direct("title", turn)) == normalized(denested)
+
+
+NODES = {
+    "user": node(message()),
+    "assistant": node(message("assistant", ["Hello!"], {"model_slug": "gpt-4", "default_model_slug": "gpt-4"})),
+    "hidden system": node(message("system", [""], {"is_visually_hidden_from_conversation": True})),
+    "visible system": node(message("system", ["Be brief"], {"is_visually_hidden_from_conversation": False})),
+    "message none": node(None),
+    "no create_time": node(message(create_time=None)),
+    "multimodal": node(message(parts=[
+        {
+            "content_type": "image_asset_pointer",
+            "asset_pointer": "file-service://file-abc",
+            "size_bytes": 12345,
+            "width": 1024,
+            "height": 768,
+            "fovea": None,
+            "metadata": None,
+        },
+        "What is in this image?",
+    ])),
+    "empty parts": node(message(parts=[])),
+    "number part": node(message(parts=[1, 2.5, None])),
+    "nested parts": node(message(parts=[["a", ["b"]], {"x": {"y": "z"}}])),
+    "hidden flag as string": node(message(metadata={"is_visually_hidden_from_conversation": "True"})),
+}
+
+
+@pytest.mark.parametrize("name", NODES)
+def test_direct_matches_denested(name):
+    assert_same_row(NODES[name])
+
+
+FALLBACK_NODES = {
+    "role not a string": node(message(role=1)),
+    "role none": node(message(role=None)),
+    "role key in metadata": node(message(metadata={"roles": ["admin"]})),
+    "part key in metadata": node(message("assistant", ["x"], {"partial": "y", "model_slug": "gpt-4"})),
+    "dash in nested key": node(message(metadata={"a-b": {"c": 1}})),
+    "model_slug prefix": node(message(metadata={"model_slug_old": "gpt-3"})),
+    "role in part": node(message(parts=[{"role": "tool", "text": "x"}])),
+    "create_time in content": node({**message(), "content": {"parts": ["x"], "create_time": 1}}),
+    "parts not a list": node({**message(), "content": {"parts": "text"}}),
+    "author not a dict": node({**message(), "author": "user"}),
+    "role next to message": {**node(message()), "role": "assistant"},
+}
+
+
+@pytest.mark.parametrize("name", FALLBACK_NODES)
+def test_unexpected_shapes_match_denested(name):
+    with pytest.raises(chatgpt._UnexpectedShape):
+        chatgpt._turn_to_datapoint_direct("title", FALLBACK_NODES[name])
+    assert_same_row(FALLBACK_NODES[name], direct=False)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_generated_nodes_match_denested(seed):
+    factory = _ConversationFactory(ExportSpec(size=0, seed=seed, multimodal=0.5, branching=0.5))
+    for _ in range(20):
+        for turn in factory.conversation()["mapping"].values():
+            assert_same_row(turn)
+
+
+@pytest.fixture(scope="module")
+def export(tmp_path_factory):
+    path = tmp_path_factory.mktemp("export") / "export.zip"
+    return generate_export(path, ExportSpec(size=parse_size("200KB"), seed=3, multimodal=0.2, branching=0.3)).path
+
+
+@pytest.mark.parametrize("traversal", chatgpt.TRAVERSALS)
+def test_parallel_matches_serial(export, traversal, monkeypatch):
+    # small batches, so several are in flight at once and have to come back in order
+    monkeypatch.setattr(chatgpt, "PARALLEL_BATCH_SIZE", 2)
+    serial = chatgpt.conversations_to_df(str(export), streaming=True, traversal=traversal)
+    parallel = chatgpt.conversations_to_df(str(export), streaming=True, workers=3, traversal=traversal)
+
+    assert len(serial) > 100
+    assert parallel.equals(serial)
+    assert parallel.dtypes.equals(serial.dtypes)
+    for column in ("conversation title", "role", "model"):
+        assert list(parallel[column].cat.categories) == list(serial[column].cat.categories)
+
+    table = chatgpt.conversations_to_df(str(export), streaming=True, workers=3, traversal=traversal, backend="table")
+    assert table.to_json() == chatgpt.conversations_to_df(str(export), traversal=traversal, backend="table").to_json()
+
+
+def conversation(*nodes, current_node=None):
+    # nodes are (id, parent, children)
+    mapping = {
+        node_id: {"id": node_id, "parent": parent, "children": list(children)} for node_id, parent, children in nodes
+    }
+    return {"mapping": mapping, "current_node": current_node}
+
+
+def ids(conversation, traversal):
+    return [turn["id"] for turn in chatgpt.iter_turns(conversation, traversal)]
+
+
+# root with a regenerated answer: b was abandoned for c, d continues from c
+BRANCHED = (("root", None, "ac"), ("a", "root", "bc"), ("b", "a", ""), ("c", "a", "d"), ("d", "c", ""))
+
+
+def test_iter_turns_branches():
+    branched = conversation(*reversed(BRANCHED), current_node="d")
+    assert ids(branched, "mapping") == ["d", "c", "b", "a", "root"]
+    assert ids(branched, "active") == ["root", "a", "c", "d"]
+    assert ids(branched, "all") == ["root", "a", "b", "c", "d"]
+
+
+@pytest.mark.parametrize("current_node", [None, "missing"])
+def test_iter_turns_active_without_current_node_is_all(current_node):
+    branched = conversation(*BRANCHED, current_node=current_node)
+    assert ids(branched, "active") == ids(branched, "all") == ["root", "a", "b", "c", "d"]
+
+
+def test_iter_turns_parent_cycle():
+    # a and b are each other's parent, c hangs below b and there is no root
+    cyclic = conversation(("a", "b", "b"), ("b", "a", "ac"), ("c", "b", ""), current_node="c")
+    assert ids(cyclic, "active") == ["a", "b", "c"]
+    assert ids(cyclic, "all") == ["a", "b", "c"]
+    assert chatgpt._active_branch(cyclic["mapping"], "a") == [cyclic["mapping"]["b"], cyclic["mapping"]["a"]]
+
+
+def test_iter_turns_unreachable_nodes_follow_in_mapping_order():
+    # y points to a parent that lists other children, x and z only have each other
+    broken = conversation(
+        ("x", "z", ""), ("root", None, "a"), ("z", "x", ""), ("a", "root", ""), ("y", "a", ""), current_node="a"
+    )
+    assert ids(broken, "all") == ["root", "a", "x", "z", "y"]
+    assert ids(broken, "active") == ["root", "a"]
+
+
+def test_iter_turns_children_not_in_mapping_or_listed_twice():
+    odd = conversation(("root", None, ["a", "gone", "a"]), ("a", "root", ["root"]))
+    assert ids(odd, "all") == ["root", "a"]
+
+
+def test_iter_turns_unknown_traversal():
+    with pytest.raises(ValueError):
+        list(chatgpt.iter_turns(conversation(*BRANCHED), "breadth first"))
+
+
+def test_all_has_the_rows_of_mapping(export):
+    def rows(traversal):
+        df = chatgpt.conversations_to_df(str(export), streaming=True, traversal=traversal)
+        return sorted(map(str, df.to_dict("records")))
+
+    mapping = rows("mapping")
+    assert len(mapping) > 100
+    assert rows("all") == mapping
+    assert len(rows("active")) < len(mapping)
@@ -0,0 +1,51 @@
+import json
+import random
+
+import pytest
+
+from port.api.commands import _split_utf8, join_donation, split_donation
+
+TEXTS = [
+    "",
+    "plain ascii",
+    "über café naïve",
+    "日本語のテキスト",
+    "𝄞 music 🎵 and emoji 👍🏽👨‍👩‍👧",
+    json.dumps({"rows": [{"message": "Zoë 😀 €", "role": "user"}] * 20}, ensure_ascii=False),
+]
+
+
+@pytest.mark.parametrize("text", TEXTS)
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5])
+@pytest.mark.parametrize("compress", [False, True])
+def test_split_and_join_donation(text, chunk_size, compress):
+    commands = split_donation("donation", text, chunk_size=chunk_size, compress=compress)
+    chunks = [command.json_string for command in commands]
+    random.Random(chunk_size).shuffle(chunks)
+
+    assert join_donation(chunks) == text
+    assert [command.key for command in commands] == [f"donation-chunk-{i}" for i in range(len(commands))]
+
+
+@pytest.mark.parametrize("text", TEXTS)
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5])
+def test_split_utf8_keeps_characters_whole(text, chunk_size):
+    data = text.encode("utf-8")
+    parts = list(_split_utf8(data, chunk_size))
+
+    assert b"".join(parts) == data
+    for part in parts:
+        decoded = part.decode("utf-8")
+        # only a single character that does not fit is allowed to exceed chunk_size
+        assert len(part) <= chunk_size or len(decoded) == 1
+
+
+def test_join_donation_incomplete_or_corrupt():
+    chunks = [c.json_string for c in split_donation("donation", "über 𝄞", chunk_size=2)]
+    with pytest.raises(ValueError):
+        join_donation(chunks[1:])
+
+    corrupt = json.loads(chunks[0])
+    corrupt["data"] = "x"
+    with pytest.raises(ValueError):
+        join_donation([json.dumps(corrupt)] + chunks[1:])
@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+from port.api.table import Table
+from port.helpers import DenestedIndex, dict_denester, find_item, find_items, split_dataframe
+
+
+def denested_export() -> dict:
+    rng = random.Random(1)
+    words = ["author", "role", "content", "parts", "model_slug", "create_time", "metadata", "a-b", "x\ny"]
+    d = {}
+    for i in range(300):
+        depth = rng.randrange(1, 5)
+        key = "-".join(rng.choice(words) + (str(rng.randrange(3)) if rng.random() < 0.3 else "") for _ in range(depth))
+        d[f"{key}-{i}"] = i
+    return d
+
+
+@pytest.mark.parametrize("key_to_match", [
+    "role", "ol", "parts", "-model_slug", "model_slug-", "author-role", "a-b-c", "time-", "-", "", "x", "y-",
+    "content-parts-0", "r.le", "part[s]", "nothing",
+])
+def test_denested_index_matches_dict(key_to_match):
+    d = denested_export()
+    index = DenestedIndex(d)
+    assert index.find_item(key_to_match) == find_item(d, key_to_match)
+    assert find_items(index, key_to_match) == find_items(d, key_to_match)
+
+
+def test_find_item_invalid_regex():
+    d = dict_denester({"a(": 1, "b": {"c": 2}})
+    for lookup in (d, DenestedIndex(d)):
+        assert find_item(lookup, "(") == ""
+        assert find_items(lookup, "(") == []
+        assert find_item(lookup, "c") == "2"
+
+
+@pytest.mark.parametrize("backend", ["pandas", "table"])
+def test_split_dataframe(backend):
+    table = Table({"n": list(range(10)), "s": [str(i) for i in range(10)]})
+    df = table.to_pandas() if backend == "pandas" else table
+    chunks = split_dataframe(df, 3)
+
+    def values(chunk):
+        return list(chunk["n"])
+
+    expected = [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]]
+    assert len(chunks) == 4
+    assert [values(chunk) for chunk in chunks] == expected
+    assert values(chunks[-1]) == [9]
+    slices = [slice(0, 2), slice(1, None), slice(None, None, -1), slice(-2, None), slice(5, 9), slice(None, None, 2)]
+    for index in slices:
+        assert [values(chunk) for chunk in chunks[index]] == expected[index]
+    with pytest.raises(IndexError):
+        chunks[4]
+    with pytest.raises(ValueError):
+        split_dataframe(df, 0)
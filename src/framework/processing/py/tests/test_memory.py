@@ -0,0 +1,33 @@
+"""
+Memory budgets of the extraction stages, see benchmarks.memory
+"""
+import pytest
+
+from benchmarks.generate import ExportSpec, generate_export, parse_size
+from benchmarks.memory import BudgetExceededError, StageMemory, check_budgets, parse_budget, profile
+
+# Peak per stage as a multiple of the size of conversations.json
+BUDGETS = [
+    "zip_read=4x",
+    "read_json_from_bytes=8x",
+    "dict_denester=2x",
+    "flatten=2x",
+    "dataframe_build=2x",
+    "to_json=4x",
+    "streaming_conversations_to_df=4x",
+]
+
+
+def test_memory_budgets(tmp_path):
+    export = generate_export(tmp_path / "export.zip", ExportSpec(size=parse_size("1MB")))
+    results = profile(str(export.path))
+    check_budgets(results, dict(parse_budget(budget, export.conversations_bytes) for budget in BUDGETS))
+
+
+def test_check_budgets():
+    results = [StageMemory("zip_read", peak=200, retained=100)]
+    check_budgets(results, {"zip_read": 200})
+    with pytest.raises(BudgetExceededError):
+        check_budgets(results, {"zip_read": 199})
+    with pytest.raises(ValueError):
+        check_budgets(results, {"unknown": 1})
@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+import port.api.props as props
+import port.script as script
+from port.api.table import Table
+
+
+@pytest.fixture
+def table_list():
+    data = Table({"role": ["user", "assistant", "user"], "message": ["a", "b", "c"]})
+    title = props.Translatable({"en": "", "nl": ""})
+    return [props.PropsUIPromptConsentFormTable("conversations", title, data, page_size=2)]
+
+
+def page(table_list, request: str) -> dict:
+    return script.render_table_page(table_list, request).toDict()["table_page"]
+
+
+def rows(table_page: dict) -> list[str]:
+    return list(json.loads(table_page["data_frame"]).get("message", {}).values())
+
+
+def test_render_table_page(table_list):
+    assert rows(page(table_list, '{"table_id": "conversations", "page": 0}')) == ["a", "b"]
+    assert rows(page(table_list, '{"table_id": "conversations", "page": 1}')) == ["c"]
+    assert rows(page(table_list, '{"table_id": "conversations", "page": 2}')) == []
+    assert rows(page(table_list, '{"table_id": "conversations", "page": -1}')) == []
+
+
+@pytest.mark.parametrize("request_string", [
+    '{"table_id": "nope", "page": 1}',
+    '{"table_id": "conversations"}',
+    '{"table_id": "conversations", "page": "x"}',
+    "[1]",
+    "not json",
+])
+def test_render_table_page_invalid(table_list, request_string):
+    table_page = page(table_list, request_string)
+    assert table_page["total_rows"] == 0
+    assert rows(table_page) == []
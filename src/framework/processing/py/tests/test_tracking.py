@@ -0,0 +1,72 @@
+import json
+import logging
+
+import pytest
+
+import port.script as script
+from port.tracking import RingBufferHandler
+
+
+@pytest.fixture
+def logger():
+    logger = logging.getLogger("tests.tracking")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    yield logger
+    logger.handlers.clear()
+
+
+def messages(records):
+    return [record["message"] for record in records]
+
+
+def test_collect_returns_new_records_once(logger):
+    handler = RingBufferHandler(capacity=10)
+    logger.addHandler(handler)
+
+    assert handler.collect() == ([], 0)
+    logger.info("a")
+    logger.info("b")
+    records, dropped = handler.collect()
+    assert messages(records) == ["a", "b"] and dropped == 0
+    assert handler.collect() == ([], 0)
+
+
+def test_collect_counts_records_pushed_out_between_collects(logger):
+    handler = RingBufferHandler(capacity=3)
+    logger.addHandler(handler)
+
+    for i in range(5):
+        logger.info("%s", i)
+    records, dropped = handler.collect()
+    assert messages(records) == ["2", "3", "4"]
+    assert [record["seq"] for record in records] == [2, 3, 4]
+    assert dropped == 2
+
+    logger.info("5")
+    logger.info("6")
+    records, dropped = handler.collect()
+    assert messages(records) == ["5", "6"] and dropped == 0
+
+    # 7 is pushed out before it is collected, the collected 5 and 6 are not counted
+    for i in range(7, 11):
+        logger.info("%s", i)
+    records, dropped = handler.collect()
+    assert messages(records) == ["8", "9", "10"] and dropped == 1
+    assert handler.n_collections == 3
+
+
+def test_donate_logs_keys():
+    script.LOG_HANDLER.reset()
+    script.LOG_HANDLER.handle(logging.makeLogRecord({"name": "script", "levelname": "INFO", "msg": "first"}))
+
+    first = script.donate_logs("session-tracking")
+    second = script.donate_logs("session-tracking")
+
+    assert first.key == "session-tracking-0"
+    assert second.key == "session-tracking-1"
+    first_data = json.loads(first.json_string)
+    assert messages(first_data["records"]) == ["first"] and first_data["dropped"] == 0
+    assert "timings" in first_data
+    assert json.loads(second.json_string)["records"] == []
+    script.LOG_HANDLER.reset()
@@ -0,0 +1,167 @@
+import codecs
+import io
+import json
+import random
+import zipfile
+
+import pandas as pd
+import pytest
+
+from port.unzipddp import (
+    iter_csv_columns_from_zip, iter_csv_from_zip, iter_json_array, iter_json_array_from_zip, read_json_from_bytes
+)
+
+
+def elements(text: str, chunk_size: int = 1 << 16) -> list:
+    return list(iter_json_array(io.StringIO(text), chunk_size=chunk_size))
+
+
+@pytest.mark.parametrize("text", [
+    "[]",
+    " [ ] \n",
+    "[1]",
+    '[1, 2.5, -3e4, "x", true, false, null]',
+    '[{"a": [1, {"b": "]"}]}, [[]], "\\"]"]',
+    '\n[\n  {"title": "a"},\n  {"title": "b"}\n]\n',
+])
+def test_iter_json_array(text):
+    assert elements(text) == json.loads(text)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7])
+def test_iter_json_array_chunk_boundaries(chunk_size):
+    text = '[123.5, -0.25e-3, 1E+2, 10, "a b", {"k": [1.5, 2]}, 7]'
+    assert elements(text, chunk_size) == json.loads(text)
+
+
+def test_iter_json_array_number_split_after_dot():
+    # the first read ends right after "123."
+    text = "[" + " " * 65531 + "123.5, 7]"
+    assert elements(text) == [123.5, 7]
+
+
+@pytest.mark.parametrize("split", ["1.", "1e", "1E", "1e-", "1e+", "-"])
+def test_iter_json_array_number_split_inside(split):
+    rest = {"1.": "5", "1e": "3", "1E": "3", "1e-": "3", "1e+": "3", "-": "2"}[split]
+    text = "[" + split + rest + "]"
+    chunk_size = len(split) + 1
+    assert elements(text, chunk_size) == json.loads(text)
+
+
+def test_iter_json_array_random_chunk_sizes():
+    rng = random.Random(0)
+
+    def value():
+        kind = rng.randrange(4)
+        if kind == 0:
+            return rng.randint(-10**6, 10**6)
+        if kind == 1:
+            return rng.uniform(-1e6, 1e6) * 10 ** rng.randint(-8, 8)
+        if kind == 2:
+            return "".join(rng.choice("ab ,[]{}\"") for _ in range(rng.randrange(6)))
+        return {"n": rng.random(), "l": [rng.randint(0, 9) for _ in range(rng.randrange(3))]}
+
+    for _ in range(500):
+        data = [value() for _ in range(rng.randrange(8))]
+        text = json.dumps(data, indent=rng.choice([None, 1]))
+        for chunk_size in (1, 2, 3, 7):
+            assert elements(text, chunk_size) == data
+
+
+@pytest.mark.parametrize("text", [
+    "[1 2]",
+    "[,,1]",
+    "[1,,2]",
+    "[1,]",
+    "[1]garbage",
+    "[1] [2]",
+    "[1",
+    "[1,",
+    "{}",
+    "",
+])
+@pytest.mark.parametrize("chunk_size", [1, 3, 1 << 16])
+def test_iter_json_array_invalid(text, chunk_size):
+    with pytest.raises(ValueError):
+        elements(text, chunk_size)
+
+
+def test_iter_json_array_from_zip(tmp_path):
+    path = tmp_path / "export.zip"
+    data = [{"title": "a", "n": 1.5}, {"title": "b", "n": 2}]
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("conversations.json", "﻿" + json.dumps(data))
+
+    assert list(iter_json_array_from_zip(str(path), "conversations.json")) == data
+    assert list(iter_json_array_from_zip(str(path), "missing.json")) == []
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "utf-8-sig", "utf-16", "utf-16-le", "utf-16-be", "utf-32", "utf-32-le"])
+def test_iter_json_array_from_zip_encodings(tmp_path, encoding):
+    path = tmp_path / "export.zip"
+    data = [{"title": "gesprek über ☕", "n": 1}, {"title": "𝄞", "n": 2}]
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("conversations.json", json.dumps(data, ensure_ascii=False).encode(encoding))
+
+    assert list(iter_json_array_from_zip(str(path), "conversations.json")) == data
+    assert read_json_from_bytes(io.BytesIO(json.dumps(data).encode(encoding))) == data
+
+
+def csv_zip(tmp_path, data: bytes):
+    path = tmp_path / "export.zip"
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("data.csv", data)
+    return str(path)
+
+
+def concat_columns(batches):
+    out = {}
+    for batch in batches:
+        for name, values in batch.items():
+            out.setdefault(name, []).extend(values)
+    return out
+
+
+@pytest.mark.parametrize("header", ["name", "naïve"])
+def test_iter_csv_falls_back_to_latin1_with_the_same_columns(tmp_path, header):
+    # decoding fails in the last batch, after two batches were read as utf-8
+    rows = "".join(f"row{i},{i}\r\n" for i in range(30_000))
+    data = codecs.BOM_UTF8 + f"{header},v\r\n{rows}".encode("utf-8") + b"caf\xe9,30000\r\n"
+    path = csv_zip(tmp_path, data)
+
+    batches = list(iter_csv_columns_from_zip(path, "data.csv"))
+    assert [list(batch) for batch in batches] == [[header, "v"]] * 4
+    columns = concat_columns(batches)
+    assert len(columns["v"]) == 30_001
+    assert columns[header][-1] == "café" and columns[header][0] == "row0"
+
+    frames = list(iter_csv_from_zip(path, "data.csv"))
+    assert [list(frame.columns) for frame in frames] == [[header, "v"]] * 4
+    df = pd.concat(frames)
+    assert list(df["v"]) == columns["v"]
+    assert df[header].iloc[-1] == "café"
+    assert list(df.index) == list(range(30_001))
+
+
+def test_iter_csv_quoted_newlines_and_ragged_rows(tmp_path):
+    data = 'name,v,w\r\n"line 1\r\nline 2",1,x\r\nshort,2\r\nlong,3,y,extra\r\n"quoted, comma",4,z\r\n'
+    path = csv_zip(tmp_path, codecs.BOM_UTF8 + data.encode("utf-8"))
+
+    columns = concat_columns(iter_csv_columns_from_zip(path, "data.csv", batch_size=2))
+    assert columns == {
+        "name": ["line 1\r\nline 2", "short", "long", "quoted, comma"],
+        "v": ["1", "2", "3", "4"],
+        "w": ["x", None, "y", "z"],
+    }
+
+    # pandas fills missing fields with empty strings
+    for chunk_size in (1, 2, 3, 10):
+        df = pd.concat(iter_csv_from_zip(path, "data.csv", chunk_size=chunk_size))
+        assert df.to_dict("list") == {**columns, "w": ["x", "", "y", "z"]}
+
+
+def test_iter_csv_missing_or_empty(tmp_path):
+    path = csv_zip(tmp_path, b"")
+    assert list(iter_csv_columns_from_zip(path, "data.csv")) == []
+    assert list(iter_csv_from_zip(path, "data.csv")) == []
+    assert list(iter_csv_columns_from_zip(path, "missing.csv")) == []
@@ -120,6 +120,9 @@ export const zTextVisualization = zVisualizationProps.merge(
     valueColumn: z.string().optional(),
     tokenize: z.boolean().optional(),
     extract: z.enum(["url_domain"]).optional(),
+    // top terms precomputed by the script, used as long as the table has nRows rows
+    topTerms: z.array(z.object({ text: z.string(), value: z.number(), importance: z.number() })).optional(),
+    nRows: z.number().optional(),
   })
 )
 export type TextVisualization = z.infer<typeof zTextVisualization>
@@ -14,6 +14,11 @@ export async function prepareTextData (table: Table, visualization: TextVisualiz
 
   if (table.body.rows.length === 0) return visualizationData
 
+  if (visualization.topTerms != null && visualization.nRows === table.body.rows.length) {
+    visualizationData.topTerms = visualization.topTerms
+    return visualizationData
+  }
+
   const texts = getTableColumn(table, visualization.textColumn)
   const values = visualization.valueColumn != null ? getTableColumn(table, visualization.valueColumn) : null
 
@@ -1,4 +1,5 @@
 import { DateFormat, Table } from "../types";
+import stopwords from "../figures/common_stopwords";
 
 export function formatDate(
   dateString: string[],
@@ -135,9 +136,14 @@ function getDomain(numbers: number[]): [number, number] {
   return [min, max];
 }
 
+// Same tokenization as port.term_frequencies in the script, so precomputed and recomputed word clouds match:
+// split on whitespace, lowercase, strip punctuation and drop stopwords and tokens without letters
+const PUNCTUATION = /^[!"#$%&'()*+,\-./:;<=>?@[\\\]^_`{|}~“”‘’«»…]+|[!"#$%&'()*+,\-./:;<=>?@[\\\]^_`{|}~“”‘’«»…]+$/gu;
+const STOPWORDS = new Set(stopwords);
+
 export function tokenize(text: string): string[] {
-  const tokens = text.split(" ");
-  return tokens.filter((token) => /\p{L}/giu.test(token)); // only tokens with word characters
+  const tokens = text.toLowerCase().split(/\s+/).map((token) => token.replace(PUNCTUATION, ""));
+  return tokens.filter((token) => !STOPWORDS.has(token) && /\p{L}/u.test(token)); // only tokens with letters
 }
 
 export function getTableColumn(table: Table, column: string): string[] {